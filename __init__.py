@@ -1 +1,17 @@
+import sys
+
 from .rtdata import RTData, RTHeader, RTLOS, RTCell
+from .index import RTIndex
+from .columnar import RTColumnar
+from .series import RTSeries, RTTrack
+from .catalog import RTCatalog
+from .cache import get_cache, read_cache, write_cache
+if sys.version_info >= (3, 7):
+    # prefetch uses async syntax and asyncio.get_running_loop (3.7).
+    from .prefetch import RTPrefetcher
+from .shared import RTShared, RTSharedHandle
+from .profiles import RTProfile, radial_percentiles
+from .refinement import RTRefinement
+from .writer import extract, write
+from .instrument import RTLoadStats
+from . import derived
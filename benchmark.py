@@ -0,0 +1,261 @@
+"""Measure the speed and memory use of each way of loading RT files.
+
+Usage: python -m <package>.benchmark [-n REPEAT] [-p PATH ...] [--json]
+                                     [--synthetic N_LOS N_CELLS [--all]]
+                                     [FILE ...]
+
+Each load path is run in a fresh interpreter, so that its peak resident set
+size is its own. With --synthetic, a file of N_LOS lines of sight of N_CELLS
+cells is generated for every version in schema_dict (or, with --all, for
+every combination of version, byte order, precision and optional blocks;
+see synthetic) in a temporary directory, and benchmarked with any FILEs.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from .columnar import RTColumnar
+from .index import RTIndex
+from .rtdata import RTData, RTHeader
+from .schemadict import schema_dict
+
+# This module, also when run with python -m.
+_MODULE = __package__ + '.benchmark'
+
+def _header(fname):
+    header = RTHeader(fname)
+    header.load()
+    return (schema_dict.header_dtype(header._version_key,
+                                     header._byteorder).itemsize, 0)
+
+def _load(fname, **kwargs):
+    d = RTData(fname, mmap=kwargs.pop('mmap', False))
+    d.load(**kwargs)
+    return (os.path.getsize(fname), len(d.LOS))
+
+# Indices built by _load_workers, by file name, so that repeats after the
+# first load in parallel, as they would with an index_cache sidecar.
+_INDICES = {}
+
+def _load_workers(fname):
+    d = RTData(fname)
+    if fname in _INDICES:
+        d._index = _INDICES[fname]
+    d.load(workers=4)
+    _INDICES[fname] = d.get_index()
+    return (os.path.getsize(fname), len(d.LOS))
+
+def _iter_los(fname):
+    d = RTData(fname)
+    return (os.path.getsize(fname), sum(1 for _ in d.iter_los()))
+
+def _index(fname):
+    return (os.path.getsize(fname), len(RTIndex.get(fname)))
+
+def _columnar(fname):
+    return (os.path.getsize(fname), len(RTColumnar.from_file(fname)))
+
+# Each load path, as a function of a file name returning the number of bytes
+# and lines of sight it covers.
+_PATHS = OrderedDict([
+    ('header', _header),
+    ('load', _load),
+    ('load_mmap', lambda fname: _load(fname, mmap=True)),
+    ('load_workers', _load_workers),
+    ('load_f4', lambda fname: _load(fname, dtypes='f4')),
+    ('iter_los', _iter_los),
+    ('index', _index),
+    ('columnar', _columnar),
+])
+
+class RTBenchmark(object):
+    """
+    The result of benchmarking one load path on one file.
+
+    Contains the members
+        fname     The file loaded
+        path      The name of the load path (a key of benchmark.paths())
+        seconds   The shortest time taken by a single load
+        nbytes    The number of bytes of the file covered by the load
+        N_LOS     The number of lines of sight loaded
+        peak_rss  The peak resident set size of the process, in bytes
+        delta_rss The increase in peak resident set size over that before
+                  the first load, in bytes
+
+    Rates are available as the properties MB_per_s and LOS_per_s. Loads are
+    repeated with the file in the page cache after the first, so they measure
+    parsing rather than disk speed. load_workers loads serially the first
+    time, recording the index, and in parallel thereafter, so needs a repeat
+    of at least 2 to measure a parallel load.
+    """
+
+    def __init__(self, fname, path, seconds, nbytes, N_LOS, peak_rss,
+                 delta_rss):
+        super(RTBenchmark, self).__init__()
+        self.fname = fname
+        self.path = path
+        self.seconds = seconds
+        self.nbytes = nbytes
+        self.N_LOS = N_LOS
+        self.peak_rss = peak_rss
+        self.delta_rss = delta_rss
+
+    @property
+    def MB_per_s(self):
+        return self.nbytes / self.seconds / 1e6 if self.seconds else None
+
+    @property
+    def LOS_per_s(self):
+        return self.N_LOS / self.seconds if self.seconds else None
+
+    def as_dict(self):
+        result = dict(self.__dict__)
+        result.update(MB_per_s=self.MB_per_s, LOS_per_s=self.LOS_per_s)
+        return result
+
+    def __str__(self):
+        return "%-32s %-12s %9.4f %10s %12s %9.1f %9.1f" % (
+            os.path.basename(self.fname)[:32], self.path, self.seconds,
+            _rate(self.MB_per_s), _rate(self.LOS_per_s) if self.N_LOS
+            else '-', self.peak_rss / 1e6, self.delta_rss / 1e6)
+
+_COLUMNS = "%-32s %-12s %9s %10s %12s %9s %9s" % (
+    'file', 'path', 'seconds', 'MB/s', 'LOS/s', 'RSS MB', '+RSS MB')
+
+def _rate(value):
+    return '-' if value is None else "%.1f" % value
+
+def paths():
+    """Return the names of the load paths which may be benchmarked."""
+    return list(_PATHS)
+
+def _peak_rss():
+    """Return the peak resident set size of this process, in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, and in kilobytes elsewhere.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def run(fname, path, repeat=3):
+    """Benchmark the load path path on fname in this process, returning an
+    RTBenchmark. The peak RSS includes everything this process has done."""
+    load = _PATHS[path]
+    before = _peak_rss()
+    best = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        (nbytes, N_LOS) = load(fname)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    peak = _peak_rss()
+    return RTBenchmark(fname, path, best, nbytes, N_LOS, peak, peak - before)
+
+def _environment():
+    """Return the environment of a child interpreter which imports this
+    package as this interpreter does."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p])
+    return env
+
+def benchmark(fname, path, repeat=3):
+    """As run, but in a fresh interpreter, so the peak RSS is that of the
+    load path alone (and of importing the package and numpy)."""
+    command = [sys.executable, '-m', _MODULE, '--run', path, '-n',
+               str(repeat), fname]
+    output = subprocess.check_output(command, env=_environment())
+    result = json.loads(output.decode('utf-8'))
+    return RTBenchmark(*(result[name] for name in (
+        'fname', 'path', 'seconds', 'nbytes', 'N_LOS', 'peak_rss',
+        'delta_rss')))
+
+def import_time(repeat=3):
+    """Return the shortest time, in seconds, taken to import this package
+    (and numpy) in a fresh interpreter."""
+    package = __package__
+    code = ("import time; start = time.perf_counter(); import %s; "
+            "print(time.perf_counter() - start)" % package)
+    times = []
+    for _ in range(max(1, repeat)):
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         env=_environment())
+        times.append(float(output.decode('utf-8')))
+    return min(times)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure the speed and memory use of each way of "
+                    "loading RT files.")
+    parser.add_argument('files', nargs='*', metavar='FILE')
+    parser.add_argument('-n', '--repeat', type=int, default=3,
+                        help="loads per path, of which the fastest is "
+                             "reported (default: 3)")
+    parser.add_argument('-p', '--path', action='append', choices=paths(),
+                        help="a load path to benchmark (default: all)")
+    parser.add_argument('--synthetic', nargs=2, type=int,
+                        metavar=('N_LOS', 'N_CELLS'),
+                        help="also benchmark generated files of every "
+                             "version")
+    parser.add_argument('--all', action='store_true',
+                        help="with --synthetic, generate every combination "
+                             "of settings")
+    parser.add_argument('--json', action='store_true',
+                        help="print results as JSON")
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run:
+        # A child of benchmark.
+        result = run(args.files[0], args.run, args.repeat)
+        print(json.dumps(result.as_dict()))
+        return 0
+
+    directory = None
+    files = list(args.files)
+    try:
+        if args.synthetic:
+            from . import synthetic
+            directory = tempfile.mkdtemp()
+            (N_LOS, N_cells) = args.synthetic
+            if args.all:
+                files += [fname for (fname, _) in synthetic.generate_all(
+                    directory, N_LOS, N_cells, seed=0)]
+            else:
+                for key in sorted(schema_dict.keys()):
+                    version = "%d.%d" % (int(key[:2]), int(key[2:]))
+                    fname = os.path.join(directory, "rt_%s.bin" % key)
+                    synthetic.generate(fname, N_LOS, N_cells, version,
+                                       seed=0)
+                    files.append(fname)
+        if not files:
+            parser.error("no files to benchmark")
+
+        seconds = import_time(args.repeat)
+        if not args.json:
+            print("import: %.4f s" % seconds)
+            print(_COLUMNS)
+        results = []
+        for fname in files:
+            for path in args.path or paths():
+                result = benchmark(fname, path, args.repeat)
+                results.append(result)
+                if not args.json:
+                    print(result)
+        if args.json:
+            print(json.dumps({'import_seconds': seconds,
+                              'results': [r.as_dict() for r in results]},
+                             indent=1))
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import json
+import os
+
+import numpy as np
+
+from .columnar import RTColumnar
+from .index import _file_stat
+from .readers import RTDataIOError, _RTBufferReader, _open_reader
+from .rtdata import RTHeader
+from .schemadict import schema_dict
+
+_MAGIC = b'RTCACHE\0'
+
+# Bump when the layout of cache files changes.
+_CACHE_FORMAT = 1
+
+# Alignment of each block within a cache file.
+_ALIGN = 64
+
+def cache_name(fname):
+    return fname + '.rtcache'
+
+def write_cache(fname, cache_fname=None, fields=None, index_cache=False):
+    """Convert an RT data file to a cache file, for fast reloading.
+
+    A cache file holds the original RT header, followed by one contiguous,
+    aligned, native-endian block per field in the RTColumnar layout, and the
+    LOS offset table. If fields is not None, only the named fields are
+    included. index_cache is as for RTData. Return the cache file name
+    (default: <fname>.rtcache).
+    """
+    if cache_fname is None:
+        cache_fname = cache_name(fname)
+    data = RTColumnar.from_file(fname, fields, index_cache)
+
+    header = data.header
+    with _open_reader(fname) as f:
+        dtype = schema_dict.header_dtype(header._version_key, header._byteorder)
+        raw_header = f.read(np.dtype('u1'), dtype.itemsize)
+
+    size, mtime = _file_stat(fname)
+    blocks = [('_header', raw_header), ('_offsets', data.offsets)]
+    blocks += sorted(data.columns.items())
+    meta = {'format': _CACHE_FORMAT, 'source': fname, 'size': size,
+            'mtime': mtime, 'blocks': []}
+
+    # Lay out blocks after the metadata, whose size depends on the offsets it
+    # contains; grow the space for it until it fits.
+    start = 0
+    while True:
+        offset = start
+        meta['blocks'] = []
+        for (name, array) in blocks:
+            meta['blocks'].append({'name': name, 'dtype': array.dtype.str,
+                                   'shape': list(array.shape),
+                                   'offset': offset})
+            offset = _aligned(offset + array.nbytes)
+        encoded = json.dumps(meta).encode('utf-8')
+        needed = _aligned(len(_MAGIC) + 8 + len(encoded))
+        if needed <= start:
+            break
+        start = needed
+
+    with open(cache_fname, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(np.array(len(encoded), dtype='<u8').tobytes())
+        f.write(encoded)
+        for ((_, array), block) in zip(blocks, meta['blocks']):
+            f.seek(block['offset'])
+            np.ascontiguousarray(array).tofile(f)
+        # Empty trailing blocks must still lie within the file.
+        f.truncate(offset)
+    return cache_fname
+
+def read_cache(cache_fname, fname=None):
+    """Load an RTColumnar from a cache file.
+
+    The file is memory mapped once, and every column is a view into the map;
+    the map is copy-on-write, so modifying a column does not modify the file.
+    The header is parsed from the original header bytes using the schema of
+    its version, so is identical to the header of the original file.
+
+    If fname is given, return None if fname has changed since the cache file
+    was written.
+    """
+    with open(cache_fname, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise RTDataIOError(cache_fname + " is not an RT cache file")
+        length, = np.frombuffer(f.read(8), dtype='<u8')
+        meta = json.loads(f.read(int(length)).decode('utf-8'))
+    if meta['format'] != _CACHE_FORMAT:
+        raise RTDataIOError("Unknown RT cache format in " + cache_fname)
+    if fname is not None and \
+            (meta['size'], meta['mtime']) != _file_stat(fname):
+        return None
+
+    buffer = np.memmap(cache_fname, dtype='u1', mode='c')
+    arrays = {}
+    for block in meta['blocks']:
+        dtype = np.dtype(block['dtype'])
+        count = int(np.prod(block['shape'], dtype=int))
+        data = np.frombuffer(buffer, dtype, count, block['offset'])
+        arrays[block['name']] = data.reshape(block['shape'])
+
+    header = RTHeader(meta['source'])
+    with _RTBufferReader(arrays.pop('_header'), meta['source']) as f:
+        header._load_metadata(f)
+        header._load(f)
+    offsets = arrays.pop('_offsets')
+    return RTColumnar(header, offsets, arrays)
+
+def get_cache(fname, cache_fname=None, fields=None):
+    """Return an RTColumnar for fname, via a cache file.
+
+    A valid cache file is loaded if one exists; otherwise fname is converted
+    first. A cache file holding only some fields is not valid if fields asks
+    for others.
+    """
+    if cache_fname is None:
+        cache_fname = cache_name(fname)
+    if os.path.exists(cache_fname):
+        data = read_cache(cache_fname, fname)
+        if data is not None and _covers(data, fields):
+            return data
+    write_cache(fname, cache_fname, fields)
+    return read_cache(cache_fname)
+
+def _covers(data, fields):
+    """Return True if data holds all the wanted fields present in its file."""
+    plan = data.header._data_plan()
+    wanted = set(plan.cell_fields + plan.los_fields) - set(['N_cells'])
+    if fields is not None:
+        wanted &= set(fields)
+    return wanted <= set(data.columns)
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
@@ -0,0 +1,225 @@
+import fnmatch
+import json
+import os
+import stat
+import sys
+
+import numpy as np
+
+from .readers import _RTBufferReader
+from .rtdata import RTHeader
+from .schemadict import schema_dict
+
+# Bump when the layout of the cache file changes.
+_CATALOG_FORMAT = 1
+
+_CACHE_NAME = '.rtcatalog.json'
+
+# Large enough to hold the header of any version.
+_HEADER_BYTES = max(schema_dict.header_dtype(key, '=').itemsize
+                    for key in schema_dict)
+
+# Header attributes recorded for each file, where present.
+_ATTRIBUTES = ('N_LOS', 'N_cells', 'flag_rates', 'flag_velocities',
+               'flag_Ncols', 'flag_refinements', 'flag_single', 'flag_dR',
+               'flag_n', 'flag_tau', 'flag_Dold', 'redshift', 'time',
+               'expansion_factor')
+
+class RTCatalog(object):
+    """
+    Header metadata for the RT snapshot files in a directory.
+
+    Contains the members
+        directory The directory catalogued
+        entries   A dict of file name (relative to directory) to a dict of
+                  metadata: size, mtime, version, byteorder ('<' or '>'),
+                  N_LOS, N_cells, flags, and redshift, time and
+                  expansion_factor for versions which record them
+        errors    A dict of file name to a dict of size, mtime and error (a
+                  message), for files which could not be read as RT snapshots
+
+    Headers are read concurrently, each with a single read. If cache is True
+    (or a file name), the catalog is saved to, and loaded from, a JSON file
+    (default: <directory>/.rtcatalog.json); on later scans only files whose
+    size or modification time have changed are read again:
+        cat = RTCatalog('run/', pattern='rt_*.dat', cache=True)
+        fname = cat.nearest('redshift', 7.5)
+
+    Contains the methods
+        scan    Update the catalog from the directory
+        nearest Return the file with a value closest to a target
+        select  Return the files matching given criteria
+        column  Return an array of one value for every file
+        save    Save the catalog to its cache file
+    """
+
+    def __init__(self, directory, pattern='*', cache=False, workers=8):
+        super(RTCatalog, self).__init__()
+        self.directory = directory
+        self.pattern = pattern
+        self.workers = workers
+        self.entries = {}
+        self.errors = {}
+
+        if cache is True:
+            cache = os.path.join(directory, _CACHE_NAME)
+        self.cache = cache or None
+        if self.cache is not None:
+            self._load_cache()
+        self.scan()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, fname):
+        return fname in self.entries
+
+    def __getitem__(self, fname):
+        return self.entries[fname]
+
+    @property
+    def fnames(self):
+        """The sorted file names of all catalogued snapshots."""
+        return sorted(self.entries)
+
+    def path(self, fname):
+        """Return the path of a catalogued file."""
+        return os.path.join(self.directory, fname)
+
+    def scan(self):
+        """Update the catalog, reading headers only of new or changed files.
+
+        The cache file, if any, is rewritten if anything changed.
+        """
+        stats = {}
+        for fname in os.listdir(self.directory):
+            if not fnmatch.fnmatch(fname, self.pattern):
+                continue
+            if fname == _CACHE_NAME or fname.endswith('.rtidx'):
+                continue
+            st = os.stat(self.path(fname))
+            if stat.S_ISREG(st.st_mode):
+                stats[fname] = (int(st.st_size), float(st.st_mtime))
+
+        known = dict(self.entries)
+        known.update(self.errors)
+        stale = [fname for (fname, st) in stats.items()
+                 if fname not in known
+                 or (known[fname]['size'], known[fname]['mtime']) != st]
+        removed = [fname for fname in known if fname not in stats]
+
+        for fname in removed + stale:
+            self.entries.pop(fname, None)
+            self.errors.pop(fname, None)
+
+        if stale:
+            for (fname, entry) in zip(stale, self._read(stale)):
+                if 'error' in entry:
+                    self.errors[fname] = entry
+                else:
+                    self.entries[fname] = entry
+
+        if self.cache is not None and (stale or removed):
+            try:
+                self.save()
+            except (IOError, OSError):
+                pass
+
+    def _read(self, fnames):
+        paths = [self.path(fname) for fname in fnames]
+        if self.workers is None or self.workers <= 1 or len(paths) == 1:
+            return [_read_entry(path) for path in paths]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            return list(pool.map(_read_entry, paths))
+
+    def column(self, name):
+        """Return an array of the value of name for every file, in the order
+        of fnames. Missing values are NaN."""
+        return np.array([self.entries[fname].get(name, np.nan)
+                         for fname in self.fnames])
+
+    def nearest(self, name, value):
+        """Return the file whose value of name is closest to value."""
+        fnames = [fname for fname in self.fnames
+                  if name in self.entries[fname]]
+        if not fnames:
+            raise KeyError("No catalogued file has a value of " + name)
+        values = np.array([self.entries[fname][name] for fname in fnames])
+        return fnames[int(np.argmin(np.abs(values - value)))]
+
+    def select(self, **criteria):
+        """Return the files whose metadata match all criteria.
+
+        Each criterion is a value to compare equal to, or a function of the
+        value returning True for a match:
+            cat.select(version='3.9', redshift=lambda z: 7 < z < 8)
+        """
+        selected = []
+        for fname in self.fnames:
+            entry = self.entries[fname]
+            for (name, test) in criteria.items():
+                if name not in entry:
+                    break
+                if callable(test):
+                    if not test(entry[name]):
+                        break
+                elif entry[name] != test:
+                    break
+            else:
+                selected.append(fname)
+        return selected
+
+    def save(self, fname=None):
+        """Save the catalog to fname (default: the cache file)."""
+        if fname is None:
+            fname = self.cache
+        with open(fname, 'w') as f:
+            json.dump({'format': _CATALOG_FORMAT, 'entries': self.entries,
+                       'errors': self.errors}, f)
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache):
+            return
+        try:
+            with open(self.cache) as f:
+                data = json.load(f)
+        except ValueError:
+            return
+        if data.get('format') != _CATALOG_FORMAT:
+            return
+        self.entries = data['entries']
+        self.errors = data['errors']
+
+def _read_entry(path):
+    """Return the catalog entry for the file at path."""
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        raw = f.read(_HEADER_BYTES)
+    entry = {'size': int(st.st_size), 'mtime': float(st.st_mtime)}
+
+    header = RTHeader(path)
+    try:
+        buffer = np.frombuffer(raw, dtype=np.uint8)
+        with _RTBufferReader(buffer, path) as reader:
+            header._load_metadata(reader)
+            header._load(reader)
+    except (IOError, ValueError) as e:
+        entry['error'] = str(e)
+        return entry
+
+    byteorder = header._byteorder
+    if byteorder == '=':
+        byteorder = '<' if sys.byteorder == 'little' else '>'
+    entry['version'] = header.version
+    entry['byteorder'] = byteorder
+    for name in _ATTRIBUTES:
+        if not hasattr(header, name):
+            continue
+        value = np.asarray(getattr(header, name)).item()
+        if name.startswith('flag_'):
+            value = bool(value)
+        entry[name] = value
+    return entry
@@ -0,0 +1,439 @@
+import numpy as np
+
+from . import derived
+from .index import RTIndex
+from .readers import _open_reader
+from .rtdata import RTHeader, RTLOS
+
+class RTColumnar(object):
+    """
+    RT data along all lines of sight, stored as one array per field.
+
+    Contains the members
+        header  The RT header (RTHeader) instance associated with this data
+        offsets CSR-style offsets; the cells of LOS i are the elements
+                offsets[i]:offsets[i + 1] of each per-cell field (N_LOS + 1
+                elements)
+        columns A dict of field name to array. Per-cell fields (R, T, ...) are
+                concatenated over all lines of sight. Per-LOS fields (cell,
+                N_bytes, Ncols, ...) have one row per line of sight. Columns
+                are in native byte order
+
+    Fields are also available as attributes, so for an RTColumnar c,
+        c.T[c.offsets[10]:c.offsets[11]]
+    is the temperature along LOS 10, and is equal to c[10].T. Indexing returns
+    an RTLOS whose attributes are views into the columns.
+
+    Derived quantities are available as attributes, as for RTLOS; per-cell
+    quantities have one element per cell, and per-LOS quantities (T_mass) one
+    per LOS.
+
+    Per-LOS reductions of per-cell fields are vectorized:
+        T_max = c.max('T')
+        T_mean = c.mean('T', weights='dR')
+
+    Interpolation and threshold crossings are also vectorized over all lines
+    of sight, e.g. to resample onto a common grid or locate ionization fronts:
+        T_grid = c.interp('T', np.linspace(1e20, 1e22, 100))
+        R_front = c.crossing('x_H1', 0.5)
+
+    An RTColumnar is created from a loaded RTData with RTData.to_columnar(), or
+    directly from file, without creating any RTLOS, with from_file().
+    """
+
+    def __init__(self, header, offsets, columns):
+        super(RTColumnar, self).__init__()
+        self.header = header
+        self.offsets = offsets
+        self.columns = columns
+        self._los_index = None
+        self._refinement = None
+
+    def __getattr__(self, name):
+        # Only called if name is not already an attribute.
+        columns = self.__dict__.get('columns')
+        if columns is None:
+            raise AttributeError("'RTColumnar' object has no attribute '%s'"
+                                 % name)
+        if name not in columns:
+            if name in derived._registry:
+                return derived._get(self, name)
+            raise AttributeError("'RTColumnar' object has no attribute '%s'"
+                                 % name)
+        return columns[name]
+
+    def __getstate__(self):
+        # As for RTLOS, cached derived values are not copied.
+        state = dict(self.__dict__)
+        state.pop('_derived', None)
+        return state
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def fname(self):
+        return self.header.fname
+
+    @property
+    def N_LOS(self):
+        return len(self)
+
+    @property
+    def N_cells(self):
+        """The number of cells in each LOS."""
+        return np.diff(self.offsets)
+
+    @property
+    def cell_fields(self):
+        """The names of the per-cell fields present."""
+        return [name for name in self.header._data_plan().cell_fields
+                if name in self.columns]
+
+    @property
+    def los_index(self):
+        """The index of the LOS containing each cell."""
+        if self._los_index is None:
+            self._los_index = np.repeat(np.arange(len(self)), self.N_cells)
+        return self._los_index
+
+    def los_slice(self, i):
+        """Return the slice of per-cell fields belonging to LOS i."""
+        i = range(len(self))[i]
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def __getitem__(self, i):
+        """Get the ith line of sight.
+
+        Return an RTLOS whose attributes are views into the columns, so
+        modifying the returned LOS will modify this data.
+        """
+        i = range(len(self))[i]
+        cells = self.los_slice(i)
+        cell_fields = set(self.cell_fields)
+
+        LOS = RTLOS(self.header)
+        if 'N_cells' in self.header._data_plan().los_fields:
+            LOS.N_cells = cells.stop - cells.start
+        for (name, column) in self.columns.items():
+            if name in cell_fields:
+                setattr(LOS, name, column[cells])
+            else:
+                setattr(LOS, name, column[i])
+        return LOS
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _values(self, values):
+        if isinstance(values, str):
+            return self.columns[values]
+        return np.asarray(values)
+
+    def reduce(self, values, ufunc=np.add, empty=None):
+        """Reduce a per-cell field over each line of sight with ufunc.
+
+        values is the name of a per-cell field, or any array with one element
+        per cell. Return an array of N_LOS elements. Lines of sight with no
+        cells take the value empty, which defaults to the identity of ufunc if
+        it has one, and NaN otherwise.
+        """
+        values = self._values(values)
+        if empty is None:
+            empty = ufunc.identity if ufunc.identity is not None else np.nan
+
+        nonempty = self.N_cells > 0
+        if not nonempty.any():
+            return np.full(len(self), empty)
+        reduced = ufunc.reduceat(values, self.offsets[:-1][nonempty])
+        dtype = np.result_type(reduced.dtype, np.min_scalar_type(empty))
+        out = np.full(len(self), empty, dtype=dtype)
+        out[nonempty] = reduced
+        return out
+
+    def sum(self, values):
+        """Return the sum of a per-cell field along each LOS."""
+        return self.reduce(values, np.add)
+
+    def min(self, values):
+        """Return the minimum of a per-cell field along each LOS."""
+        return self.reduce(values, np.minimum)
+
+    def max(self, values):
+        """Return the maximum of a per-cell field along each LOS."""
+        return self.reduce(values, np.maximum)
+
+    def mean(self, values, weights=None):
+        """Return the (weighted) mean of a per-cell field along each LOS.
+
+        weights may be a field name or an array with one element per cell.
+        Lines of sight with no cells, or zero total weight, have a mean of NaN.
+        """
+        values = self._values(values)
+        if weights is None:
+            weights = np.ones(len(values))
+        else:
+            weights = self._values(weights)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sum(values * weights) / self.sum(weights)
+
+    def refinement(self):
+        """Return the (cached) RTRefinement structure of the data."""
+        from .refinement import RTRefinement
+
+        if self._refinement is None:
+            self._refinement = RTRefinement(self)
+        return self._refinement
+
+    def searchsorted(self, values, r, los, side='left'):
+        """Find where radii would be inserted along their lines of sight.
+
+        values is a per-cell field (default use: 'R') which increases along
+        each LOS. r and los are arrays of radii and the LOS each belongs to.
+        Return, for each radius, the index into the per-cell columns at which
+        it would be inserted among the cells of its LOS, as for
+        np.searchsorted. All radii are searched together, by bisecting every
+        LOS at once.
+        """
+        values = self._values(values)
+        r = np.asarray(r)
+        lo = self.offsets[:-1][los]
+        hi = self.offsets[1:][los]
+        last = max(len(values) - 1, 0)
+        while True:
+            active = lo < hi
+            if not active.any():
+                return lo
+            mid = (lo + hi) // 2
+            midvalues = values[np.minimum(mid, last)]
+            if side == 'left':
+                right = active & (midvalues < r)
+            else:
+                right = active & (midvalues <= r)
+            lo = np.where(right, mid + 1, lo)
+            hi = np.where(active & ~right, mid, hi)
+
+    def _queries(self, radii):
+        """Return radii as an (N_LOS, M) array of queries."""
+        radii = np.asarray(radii, dtype='f8')
+        if radii.ndim == 1:
+            return np.broadcast_to(radii, (len(self), len(radii)))
+        if radii.ndim != 2 or radii.shape[0] != len(self):
+            raise ValueError("radii must be one set of radii, or one set per "
+                             "LOS")
+        return radii
+
+    def interp(self, fields, radii, left=None, right=None):
+        """Linearly interpolate per-cell fields at given radii along each LOS.
+
+        fields is a field name, or a list of them. radii is one set of radii
+        (M elements) shared by all lines of sight, or an (N_LOS, M) array of
+        radii for each LOS. Return an (N_LOS, M) array for a single field, or
+        a dict of them otherwise. As for np.interp, radii beyond the cells of
+        a LOS take the value of its first or last cell, unless left or right
+        are given. Lines of sight with no cells give NaN.
+        """
+        radii = self._queries(radii)
+        shape = radii.shape
+        r = radii.ravel()
+        los = np.repeat(np.arange(len(self)), shape[1])
+        start = self.offsets[:-1][los]
+        stop = self.offsets[1:][los]
+
+        R = self.columns['R']
+        last = max(len(R) - 1, 0)
+        j = self.searchsorted(R, r, los, side='right')
+        below = np.clip(j - 1, start, np.maximum(stop - 1, start))
+        above = np.clip(j, start, np.maximum(stop - 1, start))
+        below = np.minimum(below, last)
+        above = np.minimum(above, last)
+        R0 = R[below].astype('f8') if len(R) else np.zeros(len(r))
+        R1 = R[above].astype('f8') if len(R) else np.zeros(len(r))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(R1 > R0, (r - R0) / (R1 - R0), 0)
+
+        names = [fields] if isinstance(fields, str) else fields
+        result = {}
+        for name in names:
+            values = self.columns[name]
+            if len(values):
+                v0 = values[below].astype('f8')
+                v1 = values[above].astype('f8')
+                out = v0 + fraction * (v1 - v0)
+            else:
+                out = np.zeros(len(r))
+            if left is not None:
+                out[j == start] = left
+            if right is not None:
+                # A radius equal to the last R is inside the LOS.
+                out[(j == stop) & (r > R1)] = right
+            out[start == stop] = np.nan
+            result[name] = out.reshape(shape)
+        return result[fields] if isinstance(fields, str) else result
+
+    def first(self, mask):
+        """Return the index of the first cell of each LOS for which mask is
+        True, or -1 if there is none.
+
+        mask is a boolean array with one element per cell. Indices are into
+        the per-cell columns.
+        """
+        mask = np.asarray(mask)
+        index = np.where(mask, np.arange(len(mask)), len(mask))
+        first = self.reduce(index, np.minimum, empty=len(mask))
+        return np.where(first < self.offsets[1:], first, -1)
+
+    def crossing(self, name, threshold, above=True, interpolate=True):
+        """Return the radius at which a per-cell field first crosses a
+        threshold along each LOS.
+
+        The crossing is at the first cell whose value is greater than
+        threshold (or less than, if above is False). If interpolate is True
+        and that cell is not the first of its LOS, the radius is linearly
+        interpolated between it and the previous cell; otherwise it is the R
+        of the cell. Lines of sight which never cross give NaN. For example,
+        the position of the ionization front is
+            c.crossing('x_H1', 0.5)
+        """
+        values = self.columns[name]
+        mask = values > threshold if above else values < threshold
+        first = self.first(mask)
+        crossed = first >= 0
+        i = first[crossed]
+
+        R = self.columns['R']
+        radius = np.full(len(self), np.nan)
+        radius[crossed] = R[i]
+        if interpolate:
+            inner = i > self.offsets[:-1][crossed]
+            j = i[inner]
+            R0, R1 = R[j - 1].astype('f8'), R[j].astype('f8')
+            v0, v1 = values[j - 1].astype('f8'), values[j].astype('f8')
+            with np.errstate(invalid='ignore', divide='ignore'):
+                fraction = np.where(v1 != v0, (threshold - v0) / (v1 - v0), 1)
+            interpolated = radius[crossed]
+            interpolated[inner] = R0 + fraction * (R1 - R0)
+            radius[crossed] = interpolated
+        return radius
+
+    @classmethod
+    def from_LOS(cls, header, LOS, fields=None):
+        """Build from a sequence of RTLOS sharing header.
+
+        If fields is not None, only the named fields are kept (and any not yet
+        read are read now). Otherwise, only the fields loaded in the first
+        LOS are kept; fields skipped when loading are not read.
+        """
+        plan = header._data_plan()
+        if fields is None and len(LOS):
+            fields = _loaded(plan, LOS[0])
+        N_cells = [len(L) for L in LOS]
+        offsets = np.zeros(len(LOS) + 1, dtype='i8')
+        np.cumsum(N_cells, out=offsets[1:])
+
+        columns = {}
+        for name in plan.cell_fields:
+            if _wanted(name, fields):
+                columns[name] = np.concatenate([getattr(L, name) for L in LOS])
+        for name in plan.los_fields:
+            if _wanted(name, fields) and name != 'N_cells':
+                columns[name] = np.array([getattr(L, name) for L in LOS])
+        return cls(header, offsets, columns)
+
+    @classmethod
+    def from_file(cls, fname, fields=None, index_cache=False, dtypes=None):
+        """Build directly from an RT data file.
+
+        Each field is read straight into its place in a preallocated column.
+        If fields is not None, only the named fields are read; the rest are
+        skipped. If dtypes is not None, columns are allocated with the given
+        dtypes (see RTLOS) and each field is converted as it is read.
+        index_cache is as for RTData.
+        """
+        index = RTIndex.get(fname, index_cache)
+        header = getattr(index, 'header', None)
+        if header is None:
+            header = RTHeader(fname)
+            header.load()
+        return cls._read(header, index, fields, dtypes)
+
+    @classmethod
+    def _read(cls, header, index, fields, dtypes=None):
+        plan = header._data_plan()
+        conversions = plan.conversions(dtypes)
+        N_LOS = len(index)
+        offsets = np.zeros(N_LOS + 1, dtype='i8')
+        np.cumsum(index.N_cells, out=offsets[1:])
+
+        columns = {}
+        blocks = []
+        for (name, dtype, count) in plan.fields:
+            if name.startswith('_') or name == 'N_cells':
+                continue
+            if not _wanted(name, fields):
+                continue
+            if name in ('cell', 'N_bytes'):
+                # Already read when building the index.
+                columns[name] = getattr(index, name).astype(dtype.newbyteorder('='))
+                continue
+            dtype = conversions.get(name, dtype)
+            if isinstance(count, str):
+                columns[name] = np.empty(offsets[-1], dtype=dtype)
+            else:
+                shape = (N_LOS,) if count == 1 else (N_LOS, count)
+                columns[name] = np.empty(shape, dtype=dtype)
+            blocks.append(name)
+
+        prefix = plan.prefix.itemsize if plan.prefix is not None else 0
+        cell_fields = set(plan.cell_fields)
+        with _open_reader(header.fname) as f:
+            for i in range(N_LOS):
+                body = plan.body_for(_counts(plan, header, index, i))
+                start = index.offsets[i] + prefix
+                if fields is None:
+                    # Everything is wanted: one read, then copy out.
+                    f.seek(start)
+                    data = f.read(body, 1)
+                for name in blocks:
+                    if name in cell_fields:
+                        out = columns[name][offsets[i]:offsets[i + 1]]
+                    else:
+                        out = columns[name][i:i + 1]
+                    if fields is None:
+                        out[...] = data[name]
+                        continue
+                    (dtype, offset) = body.fields[name][:2]
+                    f.seek(start + offset)
+                    if name in conversions:
+                        out[...] = f.read(dtype.base, out.size).reshape(out.shape)
+                    else:
+                        f.read_into(out)
+
+        for (name, column) in columns.items():
+            columns[name] = _native(column)
+        return cls(header, offsets, columns)
+
+def _native(a):
+    """Convert a to native byte order in place, returning a native view."""
+    if a.dtype.isnative:
+        return a
+    return a.byteswap(inplace=True).view(a.dtype.newbyteorder())
+
+def _loaded(plan, LOS):
+    """Return the names of the stored fields held by LOS."""
+    return [name for name in plan.cell_fields + plan.los_fields
+            if name in LOS.__dict__]
+
+def _wanted(name, fields):
+    return fields is None or name in fields
+
+def _counts(plan, header, index, i):
+    """Return the count values of the body of LOS i, ordered as plan.counts."""
+    values = []
+    for count in plan.counts:
+        if count.startswith('header.'):
+            values.append(int(getattr(header, count[len('header.'):])))
+        else:
+            values.append(int(getattr(index, count)[i]))
+    return tuple(values)
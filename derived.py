@@ -0,0 +1,256 @@
+from collections import OrderedDict
+import threading
+import weakref
+
+import numpy as np
+
+# The default memory budget for cached derived values, in bytes.
+_DEFAULT_BUDGET = 1 << 28
+
+class _RTDerived(object):
+    """A registered derived quantity."""
+
+    def __init__(self, name, sources, func, doc):
+        super(_RTDerived, self).__init__()
+        self.name = name
+        self.sources = tuple(sources)
+        self.func = func
+        self.doc = doc
+
+_registry = OrderedDict()
+
+def register(name, sources, func=None, doc=None):
+    """Register a derived quantity.
+
+    func is called with an RTLOS or RTColumnar and returns the value of name,
+    computed from its attributes sources (stored fields or other derived
+    quantities). May be used as a decorator:
+        @register('n_H1', ['n_H', 'x_H1'])
+        def n_H1(data):
+            return data.n_H * data.x_H1
+    Registering an existing name replaces it. Stored fields of the same name
+    take precedence.
+    """
+    if func is None:
+        return lambda func: register(name, sources, func, doc)
+    _registry[name] = _RTDerived(name, sources, func, doc or func.__doc__)
+    return func
+
+def derived_fields():
+    """Return a dict of the name to description of each derived quantity."""
+    return OrderedDict((name, d.doc) for (name, d) in _registry.items())
+
+class _RTDerivedCache(object):
+    """
+    A least-recently-used cache of derived values with a memory budget.
+
+    Values are stored on their objects (in obj._derived), with weak
+    references to the source values they were computed from, so that a
+    cached value does not keep replaced or evicted sources alive; this object
+    tracks their sizes and order of use across all objects, and evicts the
+    least recently used when the total exceeds the budget. Entries of objects
+    which are garbage collected are forgotten.
+    """
+
+    def __init__(self, budget):
+        super(_RTDerivedCache, self).__init__()
+        self.budget = budget
+        self.nbytes = 0
+        self._lock = threading.RLock()
+        self._order = OrderedDict()
+        # Object id to (weak reference, names of its cached values).
+        self._objects = {}
+
+    def get(self, obj, name):
+        derived = _registry[name]
+        store = obj.__dict__.get('_derived')
+        sources = tuple(getattr(obj, source) for source in derived.sources)
+        if store is not None and name in store:
+            value, used = store[name]
+            if len(used) == len(sources) and \
+                    all(a() is b for (a, b) in zip(used, sources)):
+                with self._lock:
+                    key = (id(obj), name)
+                    if key in self._order:
+                        self._order.move_to_end(key)
+                return value
+
+        value = derived.func(obj)
+        self._put(obj, name, value, sources)
+        return value
+
+    def _put(self, obj, name, value, sources):
+        nbytes = int(getattr(value, 'nbytes', 0))
+        with self._lock:
+            self._forget(obj, name)
+            if nbytes > self.budget:
+                return
+            store = obj.__dict__.setdefault('_derived', {})
+            store[name] = (value, tuple(_ref(s) for s in sources))
+            token = id(obj)
+            if token not in self._objects:
+                ref = weakref.ref(obj, self._collected(token))
+                self._objects[token] = (ref, set())
+            self._objects[token][1].add(name)
+            self._order[(token, name)] = nbytes
+            self.nbytes += nbytes
+            self._evict()
+
+    def _collected(self, token):
+        def collected(ref):
+            with self._lock:
+                (_, names) = self._objects.pop(token, (None, ()))
+                for name in names:
+                    self.nbytes -= self._order.pop((token, name), 0)
+        return collected
+
+    def _evict(self):
+        while self.nbytes > self.budget and self._order:
+            ((token, name), nbytes) = self._order.popitem(last=False)
+            self.nbytes -= nbytes
+            (ref, names) = self._objects[token]
+            names.discard(name)
+            obj = ref()
+            if obj is not None:
+                obj.__dict__.get('_derived', {}).pop(name, None)
+
+    def _forget(self, obj, name):
+        store = obj.__dict__.get('_derived')
+        if store is not None:
+            store.pop(name, None)
+        nbytes = self._order.pop((id(obj), name), None)
+        if nbytes is not None:
+            self.nbytes -= nbytes
+            self._objects[id(obj)][1].discard(name)
+
+    def invalidate(self, obj, names=None):
+        """Drop the cached values of obj which depend on any of names (or all
+        of them, if names is None)."""
+        store = obj.__dict__.get('_derived')
+        if not store:
+            return
+        with self._lock:
+            for name in list(store):
+                if names is None or _depends(name, names):
+                    self._forget(obj, name)
+
+_cache = _RTDerivedCache(_DEFAULT_BUDGET)
+
+def set_budget(nbytes):
+    """Set the memory budget, in bytes, for all cached derived values."""
+    with _cache._lock:
+        _cache.budget = nbytes
+        _cache._evict()
+
+def invalidate(obj, names=None):
+    """Drop the cached derived values of an RTLOS or RTColumnar.
+
+    Replacing a stored array, or assigning to cells with RTLOS.__setitem__,
+    invalidates dependent values automatically. Call this after modifying a
+    stored array in place by other means. If names is given, only values
+    depending on those fields are dropped.
+    """
+    _cache.invalidate(obj, names)
+
+def _get(obj, name):
+    """Return the (cached) value of derived quantity name for obj."""
+    return _cache.get(obj, name)
+
+def _ref(value):
+    """Return a weak reference to value, or, for scalars, which cannot be
+    weakly referenced, a function returning it."""
+    try:
+        return weakref.ref(value)
+    except TypeError:
+        return lambda: value
+
+def _depends(name, names, depth=0):
+    """Return True if derived quantity name depends on any of names."""
+    derived = _registry.get(name)
+    if derived is None or depth > len(_registry):
+        return False
+    for source in derived.sources:
+        if source in names or _depends(source, names, depth + 1):
+            return True
+    return False
+
+def _cumsum(data, values):
+    """Return the cumulative sum of per-cell values along each LOS."""
+    total = np.cumsum(values)
+    offsets = getattr(data, 'offsets', None)
+    if offsets is None:
+        return total
+    before = np.concatenate([[0], total])[offsets[:-1]]
+    return total - np.repeat(before, np.diff(offsets))
+
+def _los_sum(data, values):
+    """Return the sum of per-cell values along each LOS."""
+    if getattr(data, 'offsets', None) is None:
+        return values.sum()
+    return data.sum(values)
+
+@register('dR', ['R'])
+def _dR(data):
+    """Width of each cell, where not stored: R less the R of the previous
+    cell (or R itself for the first)                                   [m]"""
+    R = np.asarray(data.R, dtype='f8')
+    previous = np.concatenate([[0], R[:-1]])
+    offsets = getattr(data, 'offsets', None)
+    if offsets is not None:
+        previous[offsets[:-1][np.diff(offsets) > 0]] = 0
+    return R - previous
+
+@register('volume', ['R', 'dR'])
+def _volume(data):
+    """Volume of the spherical shell of each cell, 4 pi R^2 dR       [m^3]"""
+    # In double precision, as R ** 2 overflows single precision.
+    R = np.asarray(data.R, dtype='f8')
+    return 4 * np.pi * R ** 2 * data.dR
+
+@register('n_e', ['n_H', 'n_He', 'x_H2', 'x_He2', 'x_He3'])
+def _n_e(data):
+    """Electron number density                                     [m^-3]"""
+    return data.n_H * data.x_H2 + data.n_He * (data.x_He2 + 2 * data.x_He3)
+
+@register('n_H1', ['n_H', 'x_H1'])
+def _n_H1(data):
+    """HI number density                                           [m^-3]"""
+    return data.n_H * data.x_H1
+
+@register('n_He1', ['n_He', 'x_He1'])
+def _n_He1(data):
+    """HeI number density                                          [m^-3]"""
+    return data.n_He * data.x_He1
+
+@register('n_He2', ['n_He', 'x_He2'])
+def _n_He2(data):
+    """HeII number density                                         [m^-3]"""
+    return data.n_He * data.x_He2
+
+@register('N_H1', ['n_H1', 'dR'])
+def _N_H1(data):
+    """HI column density from the start of the LOS to the outer edge of each
+    cell                                                           [m^-2]"""
+    return _cumsum(data, data.n_H1 * data.dR)
+
+@register('N_He1', ['n_He1', 'dR'])
+def _N_He1(data):
+    """HeI column density, as for N_H1                             [m^-2]"""
+    return _cumsum(data, data.n_He1 * data.dR)
+
+@register('N_He2', ['n_He2', 'dR'])
+def _N_He2(data):
+    """HeII column density, as for N_H1                            [m^-2]"""
+    return _cumsum(data, data.n_He2 * data.dR)
+
+@register('mass', ['D', 'volume'])
+def _mass(data):
+    """Mass of each cell                                             [kg]"""
+    return data.D * data.volume
+
+@register('T_mass', ['T', 'mass'])
+def _T_mass(data):
+    """Mass-weighted mean temperature of the LOS (one value per LOS)   [K]"""
+    mass = data.mass
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _los_sum(data, mass * data.T) / _los_sum(data, mass)
@@ -0,0 +1,175 @@
+import os
+
+import numpy as np
+
+from .readers import RTDataIOError, _is_path, _open_reader
+from .rtdata import RTHeader, RTLOS
+
+# Bump when the layout of the sidecar file changes.
+_INDEX_FORMAT = 1
+
+class RTIndex(object):
+    """
+    Byte offsets of every line of sight in an RT data file.
+
+    Contains the members
+        fname   Name of the indexed RT data file
+        version A string of the form 'x.y' for the indexed file version
+        offsets File offsets of each LOS, with a final entry marking the end
+                of the last LOS (N_LOS + 1 elements)
+        N_cells The number of cells in each LOS
+        cell    The cell word of each LOS
+        N_bytes The N_bytes word of each LOS (zero for versions without one)
+
+    An index is built by walking the file once, reading only the
+    single-valued words of each LOS and seeking past its data blocks:
+        index = RTIndex.build(filename)
+        LOS_40000 = index.load_LOS(40000)
+
+    An index may be saved to, and loaded from, a sidecar file. A sidecar is
+    only used if the size and modification time of the data file match those
+    recorded when the index was built.
+    """
+
+    def __init__(self, fname, version, offsets, N_cells, cell, N_bytes):
+        super(RTIndex, self).__init__()
+        self.fname = fname
+        self.version = version
+        self.offsets = offsets
+        self.N_cells = N_cells
+        self.cell = cell
+        self.N_bytes = N_bytes
+        self._stat = _file_stat(fname)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def N_LOS(self):
+        return len(self)
+
+    @property
+    def nbytes(self):
+        """The number of bytes spanned by each LOS."""
+        return np.diff(self.offsets)
+
+    @classmethod
+    def build(cls, fname):
+        """Build an index by walking the LOS in fname."""
+        _check_path(fname)
+        header = RTHeader(fname)
+        with _open_reader(fname) as f:
+            header._load_metadata(f)
+            header._load(f)
+            index = cls._walk(header, f)
+        index.header = header
+        return index
+
+    @classmethod
+    def _walk(cls, header, f):
+        N_LOS = header.N_LOS
+        offsets = np.empty(N_LOS + 1, dtype='i8')
+        N_cells = np.empty(N_LOS, dtype='i8')
+        cell = np.empty(N_LOS, dtype='i8')
+        N_bytes = np.zeros(N_LOS, dtype='i8')
+
+        size = f.size
+        offsets[0] = f.tell()
+        for i in range(N_LOS):
+            LOS = RTLOS(header)
+            offsets[i + 1] = offsets[i] + LOS._skip(f)
+            if size is not None and offsets[i + 1] > size:
+                message = "LOS %d ends beyond the end of file %s" % (i, header.fname)
+                raise RTDataIOError(message)
+            N_cells[i] = getattr(LOS, 'N_cells', header.N_cells)
+            cell[i] = LOS.cell
+            N_bytes[i] = getattr(LOS, 'N_bytes', 0)
+
+        return cls(header.fname, header.version, offsets, N_cells, cell, N_bytes)
+
+    @staticmethod
+    def sidecar_name(fname):
+        return fname + '.rtidx'
+
+    def save(self, sidecar=None):
+        """Save the index to a sidecar file (default: <fname>.rtidx)."""
+        if sidecar is None:
+            sidecar = self.sidecar_name(self.fname)
+        size, mtime = self._stat
+        with open(sidecar, 'wb') as f:
+            np.savez(f, format=_INDEX_FORMAT, size=size, mtime=mtime,
+                     version=self.version, offsets=self.offsets,
+                     N_cells=self.N_cells, cell=self.cell,
+                     N_bytes=self.N_bytes)
+
+    @classmethod
+    def load(cls, fname, sidecar=None):
+        """Load the index of fname from a sidecar file.
+
+        Return None if the sidecar is missing, of an unknown format, or out of
+        date with respect to fname.
+        """
+        if sidecar is None:
+            sidecar = cls.sidecar_name(fname)
+        if not os.path.exists(sidecar):
+            return None
+
+        with np.load(sidecar) as data:
+            if int(data['format']) != _INDEX_FORMAT:
+                return None
+            if (int(data['size']), float(data['mtime'])) != _file_stat(fname):
+                return None
+            return cls(fname, str(data['version']), data['offsets'],
+                       data['N_cells'], data['cell'], data['N_bytes'])
+
+    @classmethod
+    def get(cls, fname, sidecar=False):
+        """Return an index for fname.
+
+        If sidecar is True (or a file name), a valid sidecar is loaded in
+        preference to walking fname, and a new sidecar is written otherwise.
+        Failure to write the sidecar is not an error.
+        """
+        _check_path(fname)
+        if not sidecar:
+            return cls.build(fname)
+
+        path = None if sidecar is True else sidecar
+        index = cls.load(fname, path)
+        if index is None:
+            index = cls.build(fname)
+            try:
+                index.save(path)
+            except (IOError, OSError):
+                pass
+        return index
+
+    def load_LOS(self, i, header=None, mmap=False, fields=None, dtypes=None):
+        """Load the ith line of sight.
+
+        header is the RTHeader of the indexed file; it is loaded if not given.
+        mmap, fields and dtypes are as for RTLOS.load.
+        """
+        i = range(len(self))[i]
+        if header is None:
+            header = getattr(self, 'header', None)
+        if header is None:
+            header = RTHeader(self.fname)
+            header.load()
+            self.header = header
+
+        LOS = RTLOS(header)
+        LOS.load(int(self.offsets[i]), mmap, fields, dtypes)
+        return LOS
+
+def _check_path(fname):
+    """Raise RTDataIOError if fname is a file object, which cannot be
+    indexed: an index is only useful for seeking back into a file."""
+    if not _is_path(fname):
+        raise RTDataIOError("Random access needs a file name, not a file "
+                            "object; read it in order with load() or "
+                            "iter_los()")
+
+def _file_stat(fname):
+    st = os.stat(fname)
+    return (int(st.st_size), float(st.st_mtime))
@@ -0,0 +1,263 @@
+import sys
+import threading
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class RTLoadStats(object):
+    """
+    Statistics collected while loading RT data.
+
+    Pass an instance as the stats argument of RTData.load, RTData.iter_los
+    or RTHeader.load; every read then goes through a wrapper which counts and
+    times it. Without one, nothing is recorded and loading is unchanged.
+
+    Contains the members
+        seconds      Wall time from the start of the first load to the end of
+                     the last
+        read_s       Time spent inside reads, i.e. waiting on I/O and copying;
+                     the rest of seconds is spent interpreting the schema and
+                     building objects in Python
+        header_s     Time spent reading and parsing headers (included in
+                     the above)
+        bytes_read   The number of bytes read
+        reads        The number of reads made
+        seeks        The number of seeks which moved the file position
+        syscalls     An estimate of the system calls made for reads and seeks
+                     (memory-mapped reads make none, but fault pages in when
+                     the data is first touched)
+        N_LOS        The number of lines of sight loaded
+        LOS_s        The time taken for each LOS, in order of loading
+        LOS_bytes    The number of bytes of each LOS
+        fields       A dict of block name to [bytes, seconds]; seconds is the
+                     time spent reading the block, where it is read on its own
+                     (when loading only some fields), or converting it (when
+                     loading with dtypes), and 0 otherwise
+        major_faults Page faults which needed I/O during the loads (a large
+                     number suggests swapping, or cold memory-mapped data)
+        minor_faults Page faults which needed no I/O
+        peak_rss     The growth in the peak resident set size of the process
+                     during the loads, in bytes
+
+    If progress is not None, it is called as progress(done, total) after
+    every every lines of sight, and after the last; total is None if unknown.
+    The resource counters are not available on Windows, and are None there.
+    An instance may be used for several loads, which accumulate; it is safe
+    to share between the threads of a parallel load.
+
+    Contains the methods
+        report Return a readable summary of the statistics
+    """
+
+    def __init__(self, progress=None, every=1000):
+        super(RTLoadStats, self).__init__()
+        self.progress = progress
+        self.every = max(1, int(every))
+        self.seconds = 0.0
+        self.header_s = 0.0
+        self.read_s = 0.0
+        self.bytes_read = 0
+        self.reads = 0
+        self.seeks = 0
+        self.syscalls = 0
+        self.N_LOS = 0
+        self._LOS_s = []
+        self._LOS_bytes = []
+        self.fields = {}
+        self.major_faults = None
+        self.minor_faults = None
+        self.peak_rss = None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._start = None
+        self._usage = None
+        self._total = None
+
+    @property
+    def LOS_s(self):
+        return np.array(self._LOS_s)
+
+    @property
+    def LOS_bytes(self):
+        return np.array(self._LOS_bytes, dtype='i8')
+
+    def _begin(self):
+        """Start timing a load."""
+        with self._lock:
+            self._active += 1
+            if self._active == 1:
+                self._start = time.perf_counter()
+                self._usage = _usage()
+
+    def _expect(self, total):
+        """Add total to the number of lines of sight to be loaded."""
+        with self._lock:
+            self._total = (self._total or 0) + int(total)
+
+    def _header(self, seconds):
+        with self._lock:
+            self.header_s += seconds
+
+    def _end(self):
+        """Stop timing a load started with _begin."""
+        with self._lock:
+            self._active -= 1
+            if self._active:
+                return
+            self.seconds += time.perf_counter() - self._start
+            usage = _usage()
+            if usage is not None and self._usage is not None:
+                (major, minor, rss) = [now - before for (now, before)
+                                       in zip(usage, self._usage)]
+                self.major_faults = (self.major_faults or 0) + major
+                self.minor_faults = (self.minor_faults or 0) + minor
+                self.peak_rss = (self.peak_rss or 0) + rss
+            due = self.progress is not None and self.N_LOS % self.every
+            done, total = self.N_LOS, self._total
+        # Report the last lines of sight, if not already reported.
+        if due:
+            self.progress(done, total)
+
+    def _wrap(self, f):
+        """Return reader f, wrapped to record its reads."""
+        return _RTStatsReader(f, self)
+
+    def _read(self, nbytes, seconds, syscalls):
+        with self._lock:
+            self.bytes_read += nbytes
+            self.read_s += seconds
+            self.reads += 1
+            self.syscalls += syscalls
+
+    def _seek(self, syscalls):
+        with self._lock:
+            self.seeks += 1
+            self.syscalls += syscalls
+
+    def _field(self, name, nbytes, seconds):
+        with self._lock:
+            totals = self.fields.setdefault(name, [0, 0.0])
+            totals[0] += nbytes
+            totals[1] += seconds
+
+    def _body(self, dtype, count=1):
+        """Count the bytes of each block of count LOS records of dtype, each
+        read as a whole."""
+        with self._lock:
+            for name in dtype.names:
+                if not name.startswith('_'):
+                    totals = self.fields.setdefault(name, [0, 0.0])
+                    totals[0] += dtype.fields[name][0].itemsize * count
+
+    def _LOS(self, seconds, nbytes):
+        """Record a loaded LOS, calling progress if it is due."""
+        with self._lock:
+            self.N_LOS += 1
+            self._LOS_s.append(seconds)
+            self._LOS_bytes.append(nbytes)
+            due = self.progress is not None and self.N_LOS % self.every == 0
+            if due:
+                done, total = self.N_LOS, self._total
+        if due:
+            self.progress(done, total)
+
+    def report(self, slowest=5):
+        """Return a summary of the statistics, with the slowest LOS and the
+        blocks taking the most time and bytes."""
+        other = max(self.seconds - self.read_s, 0.0)
+        lines = [
+            "Loaded %d LOS, %.1f MB in %.3f s (%s MB/s, %s LOS/s)"
+            % (self.N_LOS, self.bytes_read / 1e6, self.seconds,
+               _rate(self.bytes_read / 1e6, self.seconds),
+               _rate(self.N_LOS, self.seconds)),
+            "  reading  %9.3f s  (%d reads, %d seeks, ~%d syscalls)"
+            % (self.read_s, self.reads, self.seeks, self.syscalls),
+            "  python   %9.3f s  (schema interpretation and objects)" % other,
+            "  headers  %9.3f s  (of the above)" % self.header_s,
+        ]
+        if self.major_faults is not None:
+            lines.append("  page faults %d major, %d minor; peak RSS grew by "
+                         "%.1f MB" % (self.major_faults, self.minor_faults,
+                                      self.peak_rss / 1e6))
+        if self.N_LOS:
+            LOS_s = self.LOS_s
+            order = np.argsort(LOS_s)[::-1][:slowest]
+            lines.append("  per LOS  median %.3g s, max %.3g s; slowest: %s"
+                         % (np.median(LOS_s), LOS_s.max(), ', '.join(
+                             "%d (%.3g s, %d bytes)"
+                             % (i, LOS_s[i], self._LOS_bytes[i])
+                             for i in order)))
+        if self.fields:
+            lines.append("  %-20s %12s %10s" % ('block', 'MB', 'seconds'))
+            for (name, (nbytes, seconds)) in sorted(
+                    self.fields.items(), key=lambda x: (-x[1][1], -x[1][0])):
+                lines.append("  %-20s %12.3f %10.4f"
+                             % (name, nbytes / 1e6, seconds))
+        return '\n'.join(lines)
+
+    __str__ = report
+
+class _RTStatsReader(object):
+    """Wrap a reader, recording each read and seek in an RTLoadStats."""
+
+    def __init__(self, f, stats):
+        super(_RTStatsReader, self).__init__()
+        self.f = f
+        self.stats = stats
+        self.mmap = f.mmap
+        # Memory-mapped and in-memory reads make no system calls; positional
+        # reads need none to seek.
+        self._read_calls = 0 if hasattr(f, 'buffer') else 1
+        self._seek_calls = int(hasattr(f, 'f') or hasattr(f, 'stream'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.f.close()
+
+    @property
+    def size(self):
+        return self.f.size
+
+    def tell(self):
+        return self.f.tell()
+
+    def seek(self, offset, whence=0):
+        if whence != 0 or offset != self.f.tell():
+            self.stats._seek(self._seek_calls)
+        self.f.seek(offset, whence)
+
+    def read(self, dtype, count):
+        start = time.perf_counter()
+        data = self.f.read(dtype, count)
+        self.stats._read(data.nbytes, time.perf_counter() - start,
+                         self._read_calls)
+        return data
+
+    def read_into(self, out):
+        start = time.perf_counter()
+        self.f.read_into(out)
+        self.stats._read(out.nbytes, time.perf_counter() - start,
+                         self._read_calls)
+
+def _usage():
+    """Return (major faults, minor faults, peak RSS in bytes) of this process,
+    or None if unavailable."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # Reported in bytes on macOS, and in kilobytes elsewhere.
+    rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return (usage.ru_majflt, usage.ru_minflt, rss)
+
+def _rate(amount, seconds):
+    return "%.1f" % (amount / seconds) if seconds else '-'
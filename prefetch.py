@@ -0,0 +1,135 @@
+import queue
+import threading
+
+# Marks the end of the data in the queue.
+_DONE = object()
+
+# How often (in seconds) a blocked reader checks whether it should stop.
+_POLL = 0.1
+
+class _RTError(object):
+    """An exception raised by the reader, to be re-raised by the consumer."""
+
+    def __init__(self, exception):
+        super(_RTError, self).__init__()
+        self.exception = exception
+
+class RTPrefetcher(object):
+    """
+    Iterate over the lines of sight of an RTData, reading ahead on a
+    background thread.
+
+    Contains the members
+        data   The RTData read from
+        depth  The most LOS (or chunks of LOS) read but not yet consumed
+        chunk  As for RTData.iter_los
+        fields As for RTData.iter_los
+        dtypes As for RTData.iter_los
+
+    While the consumer works on one LOS, the next depth are read from file, so
+    reading and analysis overlap:
+        for LOS in RTPrefetcher(RTData(fname), depth=8):
+            analyse(LOS)
+    or, within a coroutine,
+        async for LOS in RTPrefetcher(RTData(fname), depth=8):
+            await analyse(LOS)
+
+    Memory use is bounded by depth + 2 LOS (or chunks). An exception raised
+    while reading is re-raised by the consumer when it reaches the point of
+    failure. If the consumer stops early, the reader thread stops too.
+
+    Requires Python 3.7 or later, as asynchronous iteration uses
+    asyncio.get_running_loop; on earlier versions the package is importable,
+    but without RTPrefetcher.
+    """
+
+    def __init__(self, data, depth=4, chunk=None, fields=None, dtypes=None):
+        super(RTPrefetcher, self).__init__()
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.data = data
+        self.depth = depth
+        self.chunk = chunk
+        self.fields = fields
+        self.dtypes = dtypes
+
+    def _start(self):
+        """Start a reader thread, returning its queue and stop event."""
+        q = queue.Queue(self.depth)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._read, args=(q, stop))
+        thread.daemon = True
+        thread.start()
+        return q, stop, thread
+
+    def _read(self, q, stop):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=_POLL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for item in self.data.iter_los(self.chunk, self.fields,
+                                           self.dtypes):
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_RTError(e))
+            return
+        put(_DONE)
+
+    @staticmethod
+    def _stop(q, stop, thread):
+        stop.set()
+        # Unblock the reader, in case it is waiting on a full queue.
+        _drain(q)
+        thread.join()
+        # Release a consumer still waiting on the queue (if cancelled).
+        _drain(q)
+        q.put_nowait(_DONE)
+
+    @staticmethod
+    def _unwrap(item):
+        if isinstance(item, _RTError):
+            raise item.exception
+        return item
+
+    def __iter__(self):
+        q, stop, thread = self._start()
+        try:
+            while True:
+                item = q.get()
+                if item is _DONE:
+                    return
+                yield self._unwrap(item)
+        finally:
+            self._stop(q, stop, thread)
+
+    async def __aiter__(self):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        q, stop, thread = self._start()
+        try:
+            while True:
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    item = await loop.run_in_executor(None, q.get)
+                if item is _DONE:
+                    return
+                yield self._unwrap(item)
+        finally:
+            self._stop(q, stop, thread)
+
+def _drain(q):
+    """Discard everything in q."""
+    try:
+        while True:
+            q.get_nowait()
+    except queue.Empty:
+        pass
@@ -0,0 +1,269 @@
+import numpy as np
+
+from .columnar import RTColumnar
+from .rtdata import RTData, RTLOS
+
+class RTProfile(object):
+    """
+    Radially binned statistics of per-cell fields over many lines of sight.
+
+    Contains the members
+        edges   The radial bin edges (N_bins + 1 elements, increasing)
+        fields  The names of the fields profiled
+        weights The weighting of cells: None (each cell counts once), a field
+                name such as 'dR' or 'n_H', 'volume' (4 pi R^2 dR), or a tuple
+                of these to be multiplied together, e.g. ('volume', 'n_H')
+        count   The number of cells in each bin
+        weight  The total weight of the cells in each bin
+
+    Cells are binned by R; bins are half-open, [edges[i], edges[i + 1]),
+    except the last, which includes its right edge. Cells outside the edges
+    are ignored. Where dR is needed but not present in a file, the derived dR
+    is used: the difference in R between a cell and the previous cell along
+    its LOS (or R itself for the first cell; see derived).
+
+    Data is accumulated with add, which accepts an RTColumnar, an RTLOS or a
+    list of them, or an RTData. An RTData which has not been loaded is read
+    chunk by chunk with iter_los, so memory use is bounded:
+        p = RTProfile(np.logspace(20, 23, 31), ['T', 'x_H1'], weights='volume')
+        p.add(RTData(fname))
+        T, T_var = p.mean('T'), p.var('T')
+
+    The weighted mean and variance of each bin are accumulated with a
+    numerically stable pairwise update, so profiles built chunk by chunk, or
+    in separate processes and combined with merge, match a profile built in
+    one pass. Bins with no weight have a mean, variance, min and max of NaN.
+    Percentiles need all values at once, so are provided separately for
+    in-memory data by radial_percentiles.
+
+    Contains the methods
+        add   Accumulate data
+        merge Accumulate another profile with the same bins
+        mean  Return the weighted mean of a field in each bin
+        var   Return the weighted (population) variance of a field in each bin
+        std   Return the weighted standard deviation of a field in each bin
+        min   Return the minimum of a field in each bin
+        max   Return the maximum of a field in each bin
+    """
+
+    def __init__(self, edges, fields, weights=None, chunk=1024):
+        super(RTProfile, self).__init__()
+        self.edges = np.asarray(edges, dtype='f8')
+        if self.edges.ndim != 1 or len(self.edges) < 2 or \
+                np.any(np.diff(self.edges) <= 0):
+            raise ValueError("edges must be an increasing sequence of at "
+                             "least two values")
+        if isinstance(fields, str):
+            fields = [fields]
+        self.fields = list(fields)
+        self.weights = weights
+        self.chunk = chunk
+
+        N_bins = len(self.edges) - 1
+        self.count = np.zeros(N_bins, dtype='i8')
+        self.weight = np.zeros(N_bins)
+        self._mean = dict((name, np.zeros(N_bins)) for name in self.fields)
+        self._M2 = dict((name, np.zeros(N_bins)) for name in self.fields)
+        self._min = dict((name, np.full(N_bins, np.inf))
+                         for name in self.fields)
+        self._max = dict((name, np.full(N_bins, -np.inf))
+                         for name in self.fields)
+
+    def add(self, data):
+        """Accumulate the cells of data into the profile."""
+        if isinstance(data, RTData):
+            if data.LOS:
+                data = data.LOS
+            else:
+                names = _needed(self.fields, self.weights)
+                for LOS in data.iter_los(self.chunk, names):
+                    self.add(LOS)
+                return
+        if isinstance(data, RTLOS):
+            data = [data]
+        if not data:
+            return
+
+        names = _needed(self.fields, self.weights)
+        columns = _flatten(data, names)
+        arrays = _arrays(columns, names)
+        bins = _bin(arrays['R'], self.edges)
+        w = _weights(self.weights, columns)
+
+        keep = bins >= 0
+        if not keep.all():
+            bins = bins[keep]
+            w = w[keep]
+            arrays = dict((name, a[keep]) for (name, a) in arrays.items())
+        self._accumulate(bins, w, arrays)
+
+    def _accumulate(self, bins, w, arrays):
+        N_bins = len(self.count)
+        count = np.bincount(bins, minlength=N_bins)
+        weight = np.bincount(bins, w, minlength=N_bins)
+        total = self.weight + weight
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(total > 0, weight / total, 0)
+
+        for name in self.fields:
+            x = arrays[name].astype('f8')
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(weight > 0,
+                                np.bincount(bins, w * x, minlength=N_bins)
+                                / weight, 0)
+            M2 = np.bincount(bins, w * (x - mean[bins]) ** 2, minlength=N_bins)
+            self._combine(name, mean, M2, weight, fraction)
+            np.minimum.at(self._min[name], bins, x)
+            np.maximum.at(self._max[name], bins, x)
+
+        self.count += count
+        self.weight = total
+
+    def _combine(self, name, mean, M2, weight, fraction):
+        """Combine per-bin means and M2 of weight into the accumulated ones."""
+        delta = mean - self._mean[name]
+        self._mean[name] += delta * fraction
+        self._M2[name] += M2 + delta ** 2 * self.weight * fraction
+
+    def merge(self, other):
+        """Accumulate another profile with the same edges, fields and weights."""
+        if not np.array_equal(self.edges, other.edges) or \
+                self.fields != other.fields or self.weights != other.weights:
+            raise ValueError("Profiles must have the same edges, fields and "
+                             "weights to be merged")
+        total = self.weight + other.weight
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(total > 0, other.weight / total, 0)
+        for name in self.fields:
+            self._combine(name, other._mean[name], other._M2[name],
+                          other.weight, fraction)
+            np.minimum(self._min[name], other._min[name], out=self._min[name])
+            np.maximum(self._max[name], other._max[name], out=self._max[name])
+        self.count += other.count
+        self.weight = total
+
+    def _empty_nan(self, values):
+        return np.where(self.weight > 0, values, np.nan)
+
+    def mean(self, name):
+        """Return the weighted mean of a field in each bin."""
+        return self._empty_nan(self._mean[name])
+
+    def var(self, name):
+        """Return the weighted (population) variance of a field in each bin."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._empty_nan(self._M2[name] / self.weight)
+
+    def std(self, name):
+        """Return the weighted standard deviation of a field in each bin."""
+        return np.sqrt(self.var(name))
+
+    def min(self, name):
+        """Return the minimum of a field in each bin."""
+        return np.where(self.count > 0, self._min[name], np.nan)
+
+    def max(self, name):
+        """Return the maximum of a field in each bin."""
+        return np.where(self.count > 0, self._max[name], np.nan)
+
+def radial_percentiles(data, name, edges, q, weights=None):
+    """Return radially binned (weighted) percentiles of a per-cell field.
+
+    data is an RTColumnar, an RTLOS or a list of them, or a loaded RTData.
+    edges and weights are as for RTProfile; q is a percentile or sequence of
+    percentiles in [0, 100]. The result has shape (N_bins,) for a single
+    percentile, or (len(q), N_bins) otherwise; empty bins are NaN. The qth
+    percentile of a bin is the smallest value whose cumulative weight reaches
+    q% of the bin's total weight.
+    """
+    edges = np.asarray(edges, dtype='f8')
+    if isinstance(data, RTData):
+        data = data.LOS
+    if isinstance(data, RTLOS):
+        data = [data]
+    names = _needed([name], weights)
+    columns = _flatten(data, names)
+    arrays = _arrays(columns, names)
+    bins = _bin(arrays['R'], edges)
+    w = _weights(weights, columns)
+    keep = bins >= 0
+    bins, w, x = bins[keep], w[keep], arrays[name][keep].astype('f8')
+    q = np.asarray(q, dtype='f8')
+    N_bins = len(edges) - 1
+    if not len(x):
+        return np.full(q.shape + (N_bins,), np.nan)
+
+    # Sort by bin, then value, so each bin's values are contiguous and
+    # ordered; the cumulative weight then gives every bin's CDF at once.
+    order = np.lexsort((x, bins))
+    bins, w, x = bins[order], w[order], x[order]
+    cumulative = np.cumsum(w)
+    starts = np.searchsorted(bins, np.arange(N_bins))
+    stops = np.searchsorted(bins, np.arange(N_bins), side='right')
+    before = np.where(starts > 0, cumulative[np.maximum(starts - 1, 0)], 0)
+    total = np.bincount(bins, w, minlength=N_bins)
+
+    targets = before + np.multiply.outer(q / 100.0, total)
+    i = np.searchsorted(cumulative, targets)
+    i = np.clip(i, starts, np.maximum(stops - 1, starts))
+    return np.where(total > 0, x[np.minimum(i, len(x) - 1)], np.nan)
+
+def _needed(fields, weights):
+    """Return the names of the fields needed to profile fields.
+
+    dR is included where needed, but is optional, as it may be derived.
+    """
+    names = ['R'] + list(fields)
+    if weights is None:
+        weights = ()
+    elif isinstance(weights, str):
+        weights = (weights,)
+    for weight in weights:
+        if weight in ('volume', 'dR'):
+            names.append('dR')
+        else:
+            names.append(weight)
+    return sorted(set(names))
+
+def _flatten(data, names):
+    """Return data, an RTColumnar or a list of RTLOS, as an RTColumnar
+    holding names.
+
+    dR is omitted if not present, as it is then derived from R (see derived).
+    """
+    if isinstance(data, RTColumnar):
+        return data
+    present = data[0].header._data_plan().cell_fields
+    names = [name for name in names if name != 'dR' or name in present]
+    N_cells = [len(LOS.R) for LOS in data]
+    offsets = np.zeros(len(data) + 1, dtype='i8')
+    np.cumsum(N_cells, out=offsets[1:])
+    arrays = dict((name, np.concatenate([getattr(LOS, name) for LOS in data]))
+                  for name in names)
+    return RTColumnar(data[0].header, offsets, arrays)
+
+def _arrays(columns, names):
+    """Return a dict of the stored columns of names."""
+    return dict((name, columns.columns[name]) for name in names
+                if name in columns.columns)
+
+def _bin(R, edges):
+    """Return the bin of each radius, or -1 if outside the edges."""
+    bins = np.searchsorted(edges, R, side='right') - 1
+    bins[R == edges[-1]] = len(edges) - 2
+    bins[(bins < 0) | (bins >= len(edges) - 1)] = -1
+    return bins
+
+def _weights(weights, columns):
+    """Return the weight of each cell of the RTColumnar columns.
+
+    Weights are stored fields, or derived quantities such as volume and dR.
+    """
+    w = np.ones(len(columns.columns['R']))
+    if weights is None:
+        return w
+    if isinstance(weights, str):
+        weights = (weights,)
+    for weight in weights:
+        w *= getattr(columns, weight)
+    return w
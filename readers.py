@@ -0,0 +1,369 @@
+import os
+
+import numpy as np
+
+# Leading bytes of each supported compressed format.
+_MAGIC = ((b'\x1f\x8b', 'gzip'),
+          (b'\xfd7zXZ\x00', 'xz'),
+          (b'BZh', 'bz2'),
+          (b'\x28\xb5\x2f\xfd', 'zstd'))
+
+# The number of leading bytes of a stream kept, so that a header may be
+# re-read without seeking the stream.
+_HEAD_BYTES = 4096
+
+# The size of the buffer used to skip over data in a stream.
+_SKIP_BYTES = 1 << 20
+
+class RTDataIOError(IOError):
+    def __init__(self, message):
+        super(RTDataIOError, self).__init__(message)
+
+class _RTFileReader(object):
+    """Read data blocks from an open binary file with np.fromfile."""
+
+    mmap = False
+
+    def __init__(self, f):
+        super(_RTFileReader, self).__init__()
+        self.f = f
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.f.close()
+
+    @property
+    def size(self):
+        return os.fstat(self.f.fileno()).st_size
+
+    def tell(self):
+        return self.f.tell()
+
+    def seek(self, offset, whence=0):
+        self.f.seek(offset, whence)
+
+    def read(self, dtype, count):
+        data = np.fromfile(self.f, dtype, count)
+        if len(data) != count:
+            raise RTDataIOError("Unexpected end of file " + self.f.name)
+        return data
+
+    def read_into(self, out):
+        """Fill the contiguous array out from the file."""
+        if self.f.readinto(out.view(np.uint8)) != out.nbytes:
+            raise RTDataIOError("Unexpected end of file " + self.f.name)
+
+class _RTBufferReader(object):
+    """Read data blocks as views into an in-memory byte array."""
+
+    mmap = False
+
+    def __init__(self, buffer, fname):
+        super(_RTBufferReader, self).__init__()
+        self.fname = fname
+        self.buffer = buffer
+        self.pos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        # Views handed out keep the mapping alive; just drop our reference.
+        self.buffer = None
+
+    @property
+    def size(self):
+        return len(self.buffer)
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.pos = offset
+        elif whence == 1:
+            self.pos += offset
+        else:
+            self.pos = self.size + offset
+
+    def read(self, dtype, count):
+        dtype = np.dtype(dtype)
+        end = self.pos + dtype.itemsize * count
+        if end > self.size:
+            raise RTDataIOError("Unexpected end of file " + self.fname)
+        data = np.frombuffer(self.buffer, dtype, count, self.pos)
+        self.pos = end
+        return data
+
+    def read_into(self, out):
+        """Fill the contiguous array out from the file."""
+        end = self.pos + out.nbytes
+        if end > self.size:
+            raise RTDataIOError("Unexpected end of file " + self.fname)
+        out.view(np.uint8)[...] = self.buffer[self.pos:end]
+        self.pos = end
+
+class _RTMMapReader(_RTBufferReader):
+    """Read data blocks as views into a memory-mapped file.
+
+    No data is copied; pages are read from disk only when touched. The file is
+    mapped copy-on-write, so arrays may be modified without altering the file.
+    """
+
+    mmap = True
+
+    def __init__(self, fname):
+        buffer = np.memmap(fname, dtype='u1', mode='c')
+        super(_RTMMapReader, self).__init__(buffer, fname)
+
+class _RTPReader(object):
+    """Read data blocks with positional reads on a shared file descriptor.
+
+    Each reader keeps its own position, so several threads may read from one
+    open file at once. Data is read straight into preallocated arrays, and the
+    GIL is released while reading.
+    """
+
+    mmap = False
+
+    def __init__(self, fd, fname):
+        super(_RTPReader, self).__init__()
+        self.fd = fd
+        self.fname = fname
+        self.pos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        # The file descriptor belongs to the caller.
+        pass
+
+    @property
+    def size(self):
+        return os.fstat(self.fd).st_size
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.pos = offset
+        elif whence == 1:
+            self.pos += offset
+        else:
+            self.pos = self.size + offset
+
+    def read(self, dtype, count):
+        data = np.empty(count, dtype)
+        self.read_into(data)
+        return data
+
+    def read_into(self, out):
+        """Fill the contiguous array out from the file."""
+        buf = out.reshape(-1).view(np.uint8)
+        done = 0
+        while done < len(buf):
+            if hasattr(os, 'preadv'):
+                n = os.preadv(self.fd, [buf[done:]], self.pos + done)
+            else:
+                data = os.pread(self.fd, len(buf) - done, self.pos + done)
+                n = len(data)
+                buf[done:done + n] = np.frombuffer(data, np.uint8)
+            if n == 0:
+                raise RTDataIOError("Unexpected end of file " + self.fname)
+            done += n
+        self.pos += done
+
+class _RTStreamReader(object):
+    """Read data blocks from a binary stream, such as a decompressor.
+
+    Data is read with readinto straight into newly allocated arrays; data
+    skipped over is read into a single reusable buffer and discarded. Forward
+    seeks therefore always work. Backward seeks work within the first
+    _HEAD_BYTES of the stream (e.g. to re-read the header), or if the stream
+    itself is seekable. Positions are relative to the position of the stream
+    when the reader was created.
+    """
+
+    mmap = False
+
+    def __init__(self, stream, fname, closing=()):
+        super(_RTStreamReader, self).__init__()
+        self.stream = stream
+        self.fname = fname
+        # Objects to close with the reader, innermost first.
+        self._closing = closing
+        self.pos = 0
+        # The number of bytes consumed from the stream.
+        self._consumed = 0
+        self._head = bytearray()
+        self._skip_buffer = None
+        try:
+            self._start = stream.tell() if stream.seekable() else None
+        except (AttributeError, IOError, OSError):
+            self._start = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for f in self._closing:
+            f.close()
+        self._closing = ()
+
+    @property
+    def size(self):
+        # Unknown without decompressing everything.
+        return None
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence != 0:
+            raise RTDataIOError("Cannot seek from the end of stream " + self.fname)
+
+        if offset >= self.pos or offset >= self._consumed or \
+                self._consumed <= len(self._head):
+            self.pos = offset
+        elif self._start is not None:
+            self.stream.seek(self._start + offset)
+            del self._head[offset:]
+            self.pos = self._consumed = offset
+        else:
+            raise RTDataIOError("Cannot seek backwards in stream " + self.fname)
+
+    def read(self, dtype, count):
+        data = np.empty(count, dtype)
+        self.read_into(data)
+        return data
+
+    def read_into(self, out):
+        """Fill the contiguous array out from the stream."""
+        buf = memoryview(out.reshape(-1).view(np.uint8))
+        done = 0
+        if self.pos < self._consumed:
+            # Re-read from the head of the stream.
+            done = min(len(buf), self._consumed - self.pos)
+            buf[:done] = self._head[self.pos:self.pos + done]
+            self.pos += done
+        if self.pos > self._consumed:
+            self._skip(self.pos - self._consumed)
+        if done < len(buf):
+            self._fill(buf[done:])
+            self.pos = self._consumed
+
+    def _skip(self, nbytes):
+        if self._skip_buffer is None:
+            self._skip_buffer = np.empty(_SKIP_BYTES, np.uint8)
+        while nbytes > 0:
+            n = min(nbytes, _SKIP_BYTES)
+            self._fill(memoryview(self._skip_buffer)[:n])
+            nbytes -= n
+
+    def _fill(self, buf):
+        """Fill buf from the stream."""
+        done = 0
+        while done < len(buf):
+            n = self.stream.readinto(buf[done:])
+            if not n:
+                raise RTDataIOError("Unexpected end of file " + self.fname)
+            done += n
+        if self._consumed < _HEAD_BYTES:
+            self._head += buf[:_HEAD_BYTES - self._consumed]
+        self._consumed += done
+
+def _is_path(fname):
+    """Return True if fname names a file, rather than being a file object."""
+    return not hasattr(fname, 'read')
+
+def _compression(head):
+    """Return the compression format of data starting with head, or None."""
+    for (magic, name) in _MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+def _decompressor(f, name):
+    """Return a decompressing stream of the given format reading from f."""
+    if name == 'gzip':
+        import gzip
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    if name == 'bz2':
+        import bz2
+        return bz2.BZ2File(f)
+    if name == 'xz':
+        try:
+            import lzma
+        except ImportError:
+            raise RTDataIOError("Reading xz-compressed files requires lzma")
+        return lzma.LZMAFile(f)
+    try:
+        import zstandard
+    except ImportError:
+        raise RTDataIOError("Reading zstd-compressed files requires the "
+                            "zstandard package")
+    return zstandard.ZstdDecompressor().stream_reader(f)
+
+def _peek(f, nbytes):
+    """Return up to the next nbytes of f, without consuming them if possible."""
+    if hasattr(f, 'peek'):
+        return f.peek(nbytes)[:nbytes]
+    if getattr(f, 'seekable', lambda: False)():
+        pos = f.tell()
+        head = f.read(nbytes)
+        f.seek(pos)
+        return head
+    # Detection would consume the data.
+    return b''
+
+def _open_stream(f, fname, closing=()):
+    """Return a reader for the open binary file f, decompressing if needed."""
+    name = _compression(_peek(f, max(len(magic) for (magic, _) in _MAGIC)))
+    if name is not None:
+        f = _decompressor(f, name)
+        closing = (f,) + closing
+    return _RTStreamReader(f, fname, closing)
+
+def _plain_file(fname):
+    """Return True if fname names an uncompressed file."""
+    if not _is_path(fname):
+        return False
+    with open(fname, 'rb') as f:
+        return _compression(_peek(f, 8)) is None
+
+def _open_reader(fname, mmap=False):
+    """Return a reader for fname. Readers may be used as context managers.
+
+    fname may also be an open binary file object, which is read from its
+    current position and is not closed with the reader. Compressed files and
+    file objects are detected, and read through a _RTStreamReader; mmap has no
+    effect for these.
+    """
+    if not _is_path(fname):
+        return _open_stream(fname, getattr(fname, 'name', '<stream>'))
+
+    f = open(fname, 'rb')
+    if _compression(_peek(f, 8)) is not None:
+        return _open_stream(f, fname, (f,))
+    if mmap:
+        f.close()
+        return _RTMMapReader(fname)
+    return _RTFileReader(f)
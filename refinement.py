@@ -0,0 +1,138 @@
+import numpy as np
+
+class RTRefinement(object):
+    """
+    The AMR refinement structure of RT data, from cell_buffer_index.
+
+    Contains the members
+        columnar The RTColumnar described
+        child    The LOS holding the sub-cells of each cell, or -1 if the cell
+                 is not refined (one element per cell)
+        parent   The (columnar) index of the cell refined by each LOS, or -1 for
+                 top-level lines of sight (one element per LOS)
+        level    The refinement level of each LOS; 0 for top-level LOS
+        roots    The indices of the top-level lines of sight
+
+    A cell is refined if its cell_buffer_index is non-negative, in which case
+    the value is the index (in file order) of the LOS record holding its
+    sub-cells. Lines of sight which refine no cell are top-level.
+
+    The structure is built with vectorized index operations over all cells
+    at once, and is available (and cached) as
+        ref = d.refinement()    # d an RTData or RTColumnar
+
+    Contains the methods
+        flatten    Return the top-level LOS with every refined cell replaced by
+                   its sub-cells, recursively, as an RTColumnar
+        flat_index Return the original index of each flattened cell
+        leaves     Return a mask of the cells which are not refined
+    """
+
+    def __init__(self, columnar):
+        super(RTRefinement, self).__init__()
+        if 'cell_buffer_index' not in columnar.columns:
+            raise ValueError("No cell_buffer_index is present; refinements "
+                             "are not available")
+        self.columnar = columnar
+        N_LOS = len(columnar)
+
+        index = np.asarray(columnar.columns['cell_buffer_index'])
+        refined = index >= 0
+        if np.any(index[refined] >= N_LOS):
+            raise ValueError("cell_buffer_index refers to a LOS beyond the "
+                             "last")
+        self.child = np.where(refined, index, -1).astype('i8')
+
+        cells = np.nonzero(refined)[0]
+        children = self.child[cells]
+        if len(np.unique(children)) != len(children):
+            raise ValueError("A LOS refines more than one cell")
+        self.parent = np.full(N_LOS, -1, dtype='i8')
+        self.parent[children] = cells
+        self.roots = np.nonzero(self.parent < 0)[0]
+
+        # Walk down from the roots one level at a time.
+        self.level = np.full(N_LOS, -1, dtype='i8')
+        los = columnar.los_index
+        current = self.roots
+        depth = 0
+        while len(current):
+            self.level[current] = depth
+            current = self.child[np.isin(los, current) & refined]
+            depth += 1
+            if depth > N_LOS:
+                break
+        if np.any(self.level < 0):
+            raise ValueError("Refinements contain a cycle")
+        self._flat = None
+
+    @property
+    def depth(self):
+        """The number of refinement levels below the top level."""
+        return int(self.level.max()) if len(self.level) else 0
+
+    def leaves(self):
+        """Return a mask, with one element per cell, of unrefined cells."""
+        return self.child < 0
+
+    def flatten(self):
+        """Return the finest-level cells along each top-level LOS.
+
+        The result is an RTColumnar with one LOS per root, in which each
+        refined cell is replaced, in place, by the cells of the LOS refining
+        it, recursively. Per-LOS columns are those of the roots. The result
+        is cached; see also flat_index.
+        """
+        if self._flat is not None:
+            return self._flat
+
+        from .columnar import RTColumnar
+
+        c = self.columnar
+        starts = c.offsets[:-1]
+        N_cells = c.N_cells
+
+        # The cells of the roots, and the root each belongs to.
+        index = _ranges(starts[self.roots], N_cells[self.roots])
+        root = np.repeat(np.arange(len(self.roots)), N_cells[self.roots])
+        while True:
+            child = self.child[index]
+            refined = child >= 0
+            if not refined.any():
+                break
+            # Replace each refined cell by the cells of its child LOS.
+            counts = np.where(refined, N_cells[np.maximum(child, 0)], 1)
+            first = np.where(refined, starts[np.maximum(child, 0)], index)
+            index = _ranges(first, counts)
+            root = np.repeat(root, counts)
+
+        offsets = np.zeros(len(self.roots) + 1, dtype='i8')
+        np.cumsum(np.bincount(root, minlength=len(self.roots)),
+                  out=offsets[1:])
+        cell_fields = set(c.cell_fields)
+        columns = {}
+        for (name, column) in c.columns.items():
+            if name in cell_fields:
+                columns[name] = column[index]
+            else:
+                columns[name] = column[self.roots]
+        self._flat = RTColumnar(c.header, offsets, columns)
+        self._flat_index = index
+        return self._flat
+
+    def flat_index(self):
+        """Return the index, into the original per-cell columns, of each cell
+        of the flattened data. The refinement level of each flattened cell is
+        then, for example,
+            ref.level[ref.columnar.los_index[ref.flat_index()]]
+        """
+        self.flatten()
+        return self._flat_index
+
+def _ranges(starts, counts):
+    """Return the concatenation of the ranges [start, start + count)."""
+    counts = np.asarray(counts, dtype='i8')
+    total = int(counts.sum())
+    ends = np.cumsum(counts)
+    within = np.arange(total) - np.repeat(ends - counts, counts)
+    return np.repeat(np.asarray(starts, dtype='i8'), counts) + within
@@ -1,13 +1,43 @@
+import os
 import sys
-if sys.version_info >= (3, 0):
-    from functools import reduce
+import time
 
 import numpy as np
 
-from .schemadict import schema_dict
-
-def _rgetattr(x, name):
-    return reduce(getattr, [x] + name.split('.'))
+from . import derived
+from .readers import RTDataIOError, _RTPReader, _is_path, _open_reader, \
+    _plain_file
+from .schemadict import schema_dict, _byteordered
+
+# The most unconverted data read at once when converting dtypes.
+_CONVERT_BYTES = 1 << 24
+
+# The largest LOS body read whole when loading only some fields; larger
+# bodies are read a block at a time, seeking past the rest.
+_GATHER_BYTES = 1 << 16
+
+# The names set by RTLOS._set, by (record dtype, fields).
+_SET_NAMES = {}
+_MAX_SET_NAMES = 256
+
+def _set_names(dtype, fields):
+    """Return the names of the blocks of dtype to set as attributes: all
+    but padding if fields is None, and otherwise those in fields and the
+    single-valued words."""
+    key = (dtype, fields)
+    names = _SET_NAMES.get(key)
+    if names is None:
+        names = tuple(name for name in dtype.names if not name.startswith('_')
+                      and (fields is None or name in fields
+                           or dtype.fields[name][0].shape == ()))
+        if len(_SET_NAMES) >= _MAX_SET_NAMES:
+            _SET_NAMES.clear()
+        _SET_NAMES[key] = names
+    return names
+
+def _count(dtype):
+    """Return the number of elements in a (possibly sub-array) dtype."""
+    return int(np.prod(dtype.shape, dtype=int))
 
 class RTHeader(object):
     """
@@ -67,51 +97,69 @@ class RTHeader(object):
     def version(self):
         return "%d.%d" % self._version
 
-    def load(self):
-        """Load the header from the current file."""
-        with open(self.fname, 'rb') as f:
-            self._load_metadata(f)
-            self._load(f)
+    def load(self, mmap=False, stats=None):
+        """Load the header from the current file.
+
+        If mmap is True, array attributes are views into a memory map of the
+        file rather than copies. If stats is an RTLoadStats, reads are
+        recorded in it.
+        """
+        with _open_reader(self.fname, mmap) as f:
+            if stats is None:
+                self._load_metadata(f)
+                self._load(f)
+                return
+            stats._begin()
+            try:
+                self._read(stats._wrap(f), stats)
+            finally:
+                stats._end()
+
+    def _read(self, f, stats=None):
+        """Load the header from the start of reader f."""
+        start = time.perf_counter() if stats is not None else None
+        self._load_metadata(f)
+        self._load(f)
+        if stats is not None:
+            stats._header(time.perf_counter() - start)
 
     def _dtype(self, dtype):
-        dtype_str = np.dtype(dtype).str[1:] # Strip off byte order character.
-        return np.dtype(self._byteorder + dtype_str)
+        return _byteordered(dtype, self._byteorder)
 
-    def _get_byteorder(self, f):
-        at = f.tell()
-        f.seek(0)
-        self._byteorder = '='
-        check, = np.fromfile(f, self._dtype('i4'), 1)
-        if check != 1:
-            self._byteorder = '>' if sys.byteorder == 'little' else '<'
-            f.seek(0)
-            check, = np.fromfile(f, self._dtype('i4'), 1)
-            if check != 1:
-                raise RTDataIOError("Cannot determine endianness")
-        f.seek(at)
-
-    def _get_version(self, f):
-        at = f.tell()
-        f.seek(0)
-        _, major, minor = np.fromfile(f, self._dtype('i4'), 3)
-        self._version = (major, minor)
-        self._version_key = "%02d%02d" % self._version
-        f.seek(at)
+    def _data_plan(self):
+        """Return the compiled read plan for LOS data with this header."""
+        return schema_dict.plan(self._version_key, self._byteorder, self)
 
     def _load_metadata(self, f):
-        self._get_byteorder(f)
-        self._get_version(f)
+        f.seek(0)
+        self._parse_metadata(f.read(np.dtype('=i4'), 3))
         f.seek(0)
 
+    def _parse_metadata(self, words):
+        """Set byte order and version from the first three words of a file.
+
+        words should be read in native byte order.
+        """
+        if words[0] == 1:
+            self._byteorder = '='
+        elif words.byteswap()[0] == 1:
+            self._byteorder = '>' if sys.byteorder == 'little' else '<'
+        else:
+            raise RTDataIOError("Cannot determine endianness")
+
+        _, major, minor = words.view(self._dtype('i4'))
+        self._version = (int(major), int(minor))
+        self._version_key = "%02d%02d" % self._version
+        if self._version_key not in schema_dict:
+            raise RTDataIOError("Unsupported RT file version " + self.version)
+
     def _load(self, f):
-        schema, flags, _ = schema_dict[self._version_key]
-        for (name, fmt) in schema.items():
-            dtype, count = fmt
-            data = np.fromfile(f, self._dtype(dtype), count)
-            if count == 1:
-                data = data[0]
+        _, flags, _ = schema_dict[self._version_key]
+        dtype = schema_dict.header_dtype(self._version_key, self._byteorder)
+        data = f.read(dtype, 1)
+        for name in dtype.names:
             if not name.startswith('_'):
-                setattr(self, name, data)
+                setattr(self, name, data[name][0])
 
         for (name, value) in flags.items():
             setattr(self, name, value)
@@ -134,8 +182,14 @@ class RTCell(object):
         x_He3   The HeIII fraction of the cell                     [0, 1]
 
     Values which are not defined for the file version have a value of zero.
+
+    For access to many cells at once, index an RTLOS with a slice, mask or
+    array of indices instead, which returns a structured array.
     """
 
+    __slots__ = ('R', 'dR', 'D', 'entropy', 'T', 'n_H', 'n_He', 'x_H1', 'x_H2',
+                 'x_He1', 'x_He2', 'x_He3')
+
     def __init__(self, R=0, D=0, entropy=0, T=0, n_H=0, n_He=0,
                  x_H1=0, x_H2=0, x_He1=0, x_He2=0, x_He3=0, dR=0):
         super(RTCell, self).__init__()
@@ -156,17 +210,55 @@ class RTCell(object):
     def from_LOS(cls, LOS, i):
         cell = cls(LOS.R[i], LOS.D[i], LOS.entropy[i], LOS.T[i], LOS.n_H[i],
                    LOS.n_He[i], LOS.x_H1[i], LOS.x_H2[i], LOS.x_He1[i],
-                   LOS.x_He2[i], LOS.x_H3[i])
+                   LOS.x_He2[i], LOS.x_He3[i])
         if LOS.header.flag_dR:
             cell.dR = LOS.dR[i]
         return cell
 
 class RTLOS(object):
-    """A single RT line of sight. Attributes depend on the RT file version."""
+    """A single RT line of sight. Attributes depend on the RT file version.
+
+    A line of sight is normally loaded by RTData, but may be loaded directly
+    given its byte offset within the file (see RTIndex):
+        LOS = RTLOS(header)
+        LOS.load(offset)
+
+    If a list of field names is given when loading, only those data blocks are
+    kept; the rest are skipped over (or, for a short LOS, read with the others
+    in one read and dropped). Single-valued words (N_cells, cell, ...) are
+    always read. Skipped fields are read from file on first access, unless
+    the file is an open file object, in which case they are not available.
+
+    A dict of dtypes may also be given when loading, mapping field names or
+    the groups 'float' and 'int' to the dtype to store them as, e.g.
+        LOS.load(offset, dtypes={'float': 'f4', 'R': None})
+    stores all floating-point fields except R in single precision (None leaves
+    a field as stored). Each block is converted as it is read.
+
+    Derived quantities (n_e, volume, N_H1, T_mass, ...; see
+    derived.derived_fields) are also available as attributes. They are
+    computed on first access and cached, within a shared memory budget (see
+    derived.set_budget). Cached values are recomputed if a field they depend
+    on is replaced or assigned to with __setitem__; after modifying a field
+    in place by other means, call derived.invalidate(LOS).
+    """
     def __init__(self, header):
         super(RTLOS, self).__init__()
         self.header = header
 
+    def load(self, offset, mmap=False, fields=None, dtypes=None):
+        """Load the line of sight starting at byte offset in the header's file.
+
+        If mmap is True, array attributes are views into a memory map of the
+        file rather than copies (except where converted by dtypes). If fields
+        is not None, only the named fields are loaded. Names not present in
+        the file are ignored.
+        """
+        conversions = self.header._data_plan().conversions(dtypes)
+        with _open_reader(self.fname, mmap) as f:
+            f.seek(offset)
+            self._load(f, fields, conversions)
+
     @property
     def fname(self):
         return self.header.fname
@@ -176,62 +268,220 @@ class RTLOS(object):
         _, _, schema = schema_dict[self.header._version_key]
         return schema
 
-    def _load(self, f):
-        for (name, fmt) in self._schema.items():
-            if len(fmt) == 2:
-                dtype, count = fmt
-                flag = True
-            else:
-                dtype, count, flag = fmt
-
-            if dtype == 'f':
-                if self.header.flag_single:
-                    dtype = 'f4'
+    def _set(self, data, i=0, conversions={}, stats=None, copy=False,
+             fields=None):
+        """Set attributes from the ith record of a structured array.
+
+        Blocks named in conversions are converted to the given dtype, and the
+        time taken recorded in stats, if not None. If copy is True, the other
+        array blocks are copied rather than kept as views, so that data may
+        be freed once the record is set. If fields is not None, only the
+        named blocks, and single-valued words, are set.
+        """
+        if fields is not None:
+            fields = tuple(fields)
+        for name in _set_names(data.dtype, fields):
+            value = data[name][i]
+            if name in conversions:
+                if stats is None:
+                    value = value.astype(conversions[name])
                 else:
-                    dtype = 'f8'
-            dtype = self.header._dtype(dtype)
-            if isinstance(count, str):
-                count = _rgetattr(self, count)
-            if isinstance(flag, str):
-                flag = _rgetattr(self, flag)
-
-            if flag:
-                data = np.fromfile(f, dtype, count)
-                if count == 1:
-                    data = data[0]
-                if not name.startswith('_'):
-                    setattr(self, name, data)
+                    start = time.perf_counter()
+                    value = value.astype(conversions[name])
+                    stats._field(name, 0, time.perf_counter() - start)
+            elif copy and np.ndim(value):
+                value = value.copy()
+            setattr(self, name, value)
+
+    def _load(self, f, fields=None, conversions={}, stats=None):
+        """Load from reader f, positioned at the start of the LOS.
+
+        conversions is as returned by _RTReadPlan.conversions. If stats is not
+        None, the bytes and time of each block are recorded in it.
+        """
+        plan = self.header._data_plan()
+        if plan.prefix is not None:
+            self._set(f.read(plan.prefix, 1))
+        if fields is None:
+            body = plan.body(self)
+            if stats is not None:
+                stats._body(body)
+            # A view of an unconverted block would keep the whole record.
+            self._set(f.read(body, 1), 0, conversions, stats,
+                      bool(conversions) and not f.mmap)
+            return
+
+        body = plan.body(self)
+        start = f.tell()
+        if _is_path(self.fname):
+            # Skipped fields are read on access, from their offsets in body.
+            self._start = start
+            self._mmap = f.mmap
+            self._conversions = conversions
+        if f.mmap or body.itemsize <= _GATHER_BYTES:
+            # One read of a small body costs less than a seek and a read for
+            # each field; a memory-mapped body costs nothing to read.
+            if stats is not None:
+                stats._body(body)
+            self._set(f.read(body, 1), 0, conversions, stats, not f.mmap,
+                      fields)
+            return
+
+        for name in body.names:
+            if name.startswith('_'):
+                continue
+            dtype, offset = body.fields[name][:2]
+            if name in fields or dtype.shape == ():
+                if stats is not None:
+                    t = time.perf_counter()
+                f.seek(start + offset)
+                self._set_block(name, dtype, f.read(dtype.base, _count(dtype)))
+                if stats is not None:
+                    stats._field(name, dtype.itemsize,
+                                 time.perf_counter() - t)
+        f.seek(start + body.itemsize)
+
+    def _lazy_block(self, name):
+        """Return (offset, dtype) of the block name if it was skipped when
+        loading and may be read from file, and None otherwise."""
+        start = self.__dict__.get('_start')
+        if start is None or name.startswith('_') or name in self.__dict__:
+            return None
+        body = self.header._data_plan().body(self)
+        if name not in body.fields:
+            return None
+        dtype, offset = body.fields[name][:2]
+        return (start + offset, dtype)
+
+    def _set_block(self, name, dtype, data):
+        if dtype.shape == ():
+            data = data[0]
+        elif name in self._conversions:
+            data = data.astype(self._conversions[name])
+        setattr(self, name, data)
+
+    def __getattr__(self, name):
+        # Only called if name is not already an attribute. Fields skipped when
+        # loading are read now; derived quantities are computed (or fetched
+        # from the cache).
+        block = self._lazy_block(name)
+        if block is None:
+            if name in derived._registry and 'header' in self.__dict__:
+                return derived._get(self, name)
+            raise AttributeError("'RTLOS' object has no attribute '%s'" % name)
+
+        offset, dtype = block
+        with _open_reader(self.fname, self._mmap) as f:
+            f.seek(offset)
+            self._set_block(name, dtype, f.read(dtype.base, _count(dtype)))
+        return self.__dict__[name]
+
+    def __getstate__(self):
+        # Cached derived values hold weak references, and a copy would be
+        # outside the cache's budget; they are recomputed when needed.
+        state = dict(self.__dict__)
+        state.pop('_derived', None)
+        return state
+
+    def _skip(self, f):
+        """Seek past this LOS, reading only its single-valued words.
+
+        Return the number of bytes spanned by the LOS.
+        """
+        plan = self.header._data_plan()
+        nbytes = 0
+        if plan.prefix is not None:
+            self._set(f.read(plan.prefix, 1))
+            nbytes += plan.prefix.itemsize
+
+        body = plan.body(self)
+        start = f.tell()
+        for name in body.names:
+            dtype, offset = body.fields[name][:2]
+            if dtype.shape == () and not name.startswith('_'):
+                f.seek(start + offset)
+                setattr(self, name, f.read(dtype, 1)[0])
+        f.seek(start + body.itemsize)
+        nbytes += body.itemsize
+        return nbytes
+
+    def __len__(self):
+        """Return the number of cells in the line of sight."""
+        return int(getattr(self, 'N_cells', self.header.N_cells))
+
+    @property
+    def cell_fields(self):
+        """The names of the loaded per-cell fields."""
+        return [name for name in self.header._data_plan().cell_fields
+                if name in self.__dict__]
+
+    def cells(self, index=slice(None), fields=None):
+        """Return a copy of the selected cells as a structured array.
+
+        index may be anything which indexes a NumPy array: a slice, a boolean
+        mask or an array of indices. The structured array has one native-endian
+        field per loaded per-cell field, or only those named in fields. Fields
+        are accessed by name, e.g. cells['T'] (cells.T is the transpose).
+        """
+        if fields is None:
+            fields = self.cell_fields
+        columns = [getattr(self, name)[index] for name in fields]
+        dtype = [(name, column.dtype.newbyteorder('='))
+                 for (name, column) in zip(fields, columns)]
+        shape = columns[0].shape if columns else (0,)
+        records = np.empty(shape, dtype=dtype)
+        for (name, column) in zip(fields, columns):
+            records[name] = column
+        return records
 
     def __getitem__(self, index):
-        """Get the ith cell from the line of sight.
+        """Get cells from the line of sight.
 
-        Return a copy of the data as an RTCell.
+        If index is an integer, return a copy of the ith cell as an RTCell.
+        Otherwise, index may be a slice, boolean mask or array of indices, and
+        a copy of the selected cells is returned as a structured array (see
+        cells).
         """
-        if index >= self.N_cells or index < 0:
-            raise IndexError("Cell index " + str(index) + " is out of bounds")
+        if isinstance(index, (int, np.integer)):
+            if index >= len(self) or index < 0:
+                raise IndexError("Cell index " + str(index) + " is out of bounds")
+            return RTCell.from_LOS(self, index)
 
-        return RTCell.from_LOS(self, index)
+        return self.cells(index)
 
     def __setitem__(self, index, value):
-        """Set the ith values for each of the line of sight properties.
+        """Set the values of cells along the line of sight.
 
-        value should be an RTCell, or compatible object."""
-        if index >= self.N_cells or index < 0:
+        If index is an integer, value should be an RTCell, or compatible
+        object. Otherwise, index may be a slice, boolean mask or array of
+        indices, and value a structured array, each of whose fields is
+        assigned to the selected cells.
+        """
+        if not isinstance(index, (int, np.integer)):
+            for name in value.dtype.names:
+                if name not in self.header._data_plan().cell_fields:
+                    raise ValueError(name + " is not a per-cell field")
+                getattr(self, name)[index] = value[name]
+            derived.invalidate(self, value.dtype.names)
+            return
+
+        if index >= len(self) or index < 0:
             raise IndexError("Cell index " + str(index) + " is out of bounds")
 
         self.R[index] = value.R
-        if self.header.flags.dR:
+        if self.header.flag_dR:
             self.dR[index] = value.dR
         self.D[index] = value.D
         self.entropy[index] = value.entropy
         self.T[index] = value.T
         self.n_H[index] = value.n_H
-        self.n_He[index] = value.n_he
+        self.n_He[index] = value.n_He
         self.x_H1[index] = value.x_H1
         self.x_H2[index] = value.x_H2
         self.x_He1[index] = value.x_He1
         self.x_He2[index] = value.x_He2
         self.x_He3[index] = value.x_He3
+        derived.invalidate(self, RTCell.__slots__)
 
 class RTData(object):
     """
@@ -243,18 +493,50 @@ class RTData(object):
 
     Lines of sight within LOS may be accessed as:
         d = RTData(filename)
+        d.load()
         LOS_10 = d[10]
         LOS_10 is d.LOS[10] # True
 
+    If load has not been called, d[i] instead reads only the ith line of sight
+    from file, using an RTIndex of LOS byte offsets. The index is built on
+    first use; if index_cache is True (or a file name) it is also saved to, or
+    loaded from, a sidecar file (see RTIndex).
+
+    If mmap is True, the file is memory mapped and every array attribute of the
+    header and lines of sight is a view into the map, in the file's byte order.
+    Nothing is read from disk until it is accessed. The map is copy-on-write:
+    modifying the arrays does not modify the file.
+
+    Files compressed with gzip, xz, bzip2 or zstd (the last requires the
+    zstandard package) are detected and decompressed as they are read, without
+    a temporary copy; mmap has no effect for these. filename may also be an
+    open binary file object, read once from its current position, e.g.
+        d = RTData(sys.stdin.buffer)
+        for LOS in d.iter_los(): ...
+    Random access (d[i] and to_columnar() before load, get_index, RTIndex,
+    RTColumnar.from_file) needs a file name, raising RTDataIOError for a file
+    object, and is slow for compressed files, which must be decompressed up
+    to each LOS.
+
     Contains the methods
-        load Load all lines of sight from file
+        load        Load all lines of sight from file
+        iter_los    Iterate over lines of sight without storing them
+        to_columnar Return the data as an RTColumnar, one array per field
+        refinement  Return the AMR refinement structure of the data
+        save        Write the data to a new file
+        verify      Check the structure of the file without reading its data
+        get_index   Return the RTIndex of LOS byte offsets for the file
     """
 
-    def __init__(self, fname):
+    def __init__(self, fname, index_cache=False, mmap=False):
         super(RTData, self).__init__()
         self._fname = fname
         self.header = RTHeader(fname)
         self.LOS = []
+        self.index_cache = index_cache
+        self.mmap = mmap
+        self._index = None
+        self._refinement = None
 
     @property
     def fname(self):
@@ -264,20 +546,297 @@ class RTData(object):
     def fname(self, fname):
         self._fname = fname
         self.header.fname = fname
+        self._index = None
+        self._refinement = None
+
+    def load(self, fields=None, workers=None, dtypes=None, stats=None):
+        """Load all lines of sight from file.
+
+        If fields is not None, only the named fields are loaded. If dtypes is
+        not None, fields are converted to the given dtypes as they are read,
+        so the full-precision data is never held in memory at once (see
+        RTLOS).
+
+        If workers is greater than one, lines of sight are read concurrently
+        by that many threads, using the RTIndex of LOS byte offsets. Each
+        thread reads its share of the file with positional reads into
+        preallocated arrays. The result is identical to a serial load. An
+        index must already exist, i.e. have been built by an earlier
+        get_index(), d[i] or load(), or be held in a valid index_cache
+        sidecar; otherwise the load is serial, as building the index takes a
+        serial walk of the file, which costs more than the threads save. A
+        serial load of a file records the offset of each LOS as it goes, so
+        sets the index (and writes the sidecar, with index_cache) for later
+        loads at no extra cost. workers
+        also has no effect if mmap is True, as nothing is read when loading,
+        or for compressed files and file objects, which are read in order.
+
+        If stats is an RTLoadStats, every read is counted and timed, and the
+        time and size of each LOS and block recorded in it; its progress
+        callback, if any, is called as lines of sight are loaded.
+        """
+        if stats is not None:
+            stats._begin()
+        try:
+            if workers is not None and workers > 1 and not self.mmap \
+                    and hasattr(os, 'pread') and _plain_file(self.fname) \
+                    and self._existing_index() is not None:
+                self._load_parallel(fields, workers, dtypes, stats)
+                return
+
+            with _open_reader(self.fname, self.mmap) as f:
+                if stats is not None:
+                    f = stats._wrap(f)
+                self.header._read(f, stats)
+                if stats is not None:
+                    stats._expect(self.header.N_LOS)
+                block = max(1, self.header.N_LOS)
+                offsets = None
+                if self._index is None and _plain_file(self.fname):
+                    offsets = []
+                self.LOS = list(self._iter_los(f, fields, dtypes, block,
+                                               stats, offsets))
+            if offsets is not None:
+                self._set_index(offsets)
+        finally:
+            if stats is not None:
+                stats._end()
+
+    def _load_parallel(self, fields, workers, dtypes, stats=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.header.load(stats=stats)
+        index = self.get_index()
+        if stats is not None:
+            stats._expect(len(index))
+        conversions = self.header._data_plan().conversions(dtypes)
+
+        # Split the LOS into a few contiguous ranges per worker, of roughly
+        # equal size in bytes.
+        N_LOS = len(index)
+        targets = np.linspace(index.offsets[0], index.offsets[-1],
+                              min(N_LOS, 4 * workers) + 1)
+        bounds = np.unique(np.searchsorted(index.offsets[:-1], targets))
+        bounds = np.unique(np.concatenate([[0], bounds, [N_LOS]]))
+
+        def load_range(fd, start, stop):
+            f = _RTPReader(fd, self.fname)
+            if stats is not None:
+                f = stats._wrap(f)
+            LOS_range = []
+            for i in range(start, stop):
+                if stats is not None:
+                    t = time.perf_counter()
+                f.seek(index.offsets[i])
+                LOS = RTLOS(self.header)
+                LOS._load(f, fields, conversions, stats)
+                LOS_range.append(LOS)
+                if stats is not None:
+                    stats._LOS(time.perf_counter() - t,
+                               int(index.offsets[i + 1] - index.offsets[i]))
+            return LOS_range
 
-    def load(self):
         with open(self.fname, 'rb') as f:
-            self.header._load_metadata(f)
-            self.header._load(f)
-            self.LOS = []
-            for i in range(self.header.N_LOS):
+            fd = f.fileno()
+            with ThreadPoolExecutor(workers) as pool:
+                ranges = pool.map(load_range, [fd] * (len(bounds) - 1),
+                                  bounds[:-1], bounds[1:])
+                self.LOS = [LOS for LOS_range in ranges for LOS in LOS_range]
+
+    def iter_los(self, chunk=None, fields=None, dtypes=None, stats=None):
+        """Iterate over all lines of sight in the file, without storing them.
+
+        The header is loaded once, and lines of sight are then read one at a
+        time from a single open file. If chunk is None, each RTLOS is yielded
+        in turn; otherwise lists of (up to) chunk RTLOS are yielded. fields,
+        dtypes and stats are as for load; time spent by the caller between
+        lines of sight is not included in the statistics of each LOS.
+
+        Memory use is bounded by the size of one chunk, provided the caller
+        does not keep references to earlier lines of sight.
+        """
+        if stats is not None:
+            stats._begin()
+        try:
+            with _open_reader(self.fname, self.mmap) as f:
+                if stats is not None:
+                    f = stats._wrap(f)
+                self.header._read(f, stats)
+                if stats is not None:
+                    stats._expect(self.header.N_LOS)
+                batch = []
+                for LOS in self._iter_los(f, fields, dtypes, chunk or 1,
+                                          stats):
+                    if chunk is None:
+                        yield LOS
+                        continue
+                    batch.append(LOS)
+                    if len(batch) == chunk:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+        finally:
+            if stats is not None:
+                stats._end()
+
+    def _iter_los(self, f, fields, dtypes, block, stats=None, offsets=None):
+        """Yield each LOS read from f, which must be positioned after the
+        header.
+
+        Where all LOS have the same layout, up to block LOS are read at once;
+        fewer if they are to be converted, to bound the memory used by the
+        unconverted data. If stats is not None, each LOS is recorded in it,
+        with an equal share of the time of a block read. If offsets is not
+        None, the offset of each LOS, and of the end of the last, are
+        appended to it.
+        """
+        plan = self.header._data_plan()
+        conversions = plan.conversions(dtypes)
+        N_LOS = self.header.N_LOS
+        if not plan.fixed or fields is not None:
+            for i in range(N_LOS):
+                start = f.tell() if offsets is not None or stats is not None \
+                    else None
+                if offsets is not None:
+                    offsets.append(start)
+                if stats is not None:
+                    t = time.perf_counter()
+                LOS = RTLOS(self.header)
+                LOS._load(f, fields, conversions, stats)
+                if stats is not None:
+                    stats._LOS(time.perf_counter() - t, f.tell() - start)
+                yield LOS
+            if offsets is not None:
+                offsets.append(f.tell())
+            return
+
+        dtype = plan.dtype(RTLOS(self.header))
+        if offsets is not None:
+            first = f.tell()
+            offsets.extend(first + dtype.itemsize * np.arange(N_LOS + 1))
+        if conversions:
+            block = max(1, min(block, _CONVERT_BYTES // dtype.itemsize))
+        # Unconverted blocks are copied, so that each block read is freed.
+        copy = bool(conversions) and not f.mmap
+        for start in range(0, N_LOS, block):
+            if stats is not None:
+                t = time.perf_counter()
+            data = f.read(dtype, min(block, N_LOS - start))
+            if stats is not None:
+                stats._body(dtype, len(data))
+                share = (time.perf_counter() - t) / max(len(data), 1)
+            for i in range(len(data)):
+                if stats is not None:
+                    t = time.perf_counter()
                 LOS = RTLOS(self.header)
-                LOS._load(f)
-                self.LOS.append(LOS)
+                LOS._set(data, i, conversions, stats, copy)
+                if stats is not None:
+                    stats._LOS(share + time.perf_counter() - t, dtype.itemsize)
+                yield LOS
+
+    def to_columnar(self, fields=None):
+        """Return the data as an RTColumnar, one array per field.
+
+        If all lines of sight have been loaded, they are copied into columns.
+        Otherwise, the columns are read directly from file. If fields is not
+        None, only the named fields are included.
+        """
+        from .columnar import RTColumnar
+
+        if self.LOS:
+            return RTColumnar.from_LOS(self.header, self.LOS, fields)
+        return RTColumnar.from_file(self.fname, fields, self.index_cache)
+
+    def refinement(self):
+        """Return the RTRefinement (AMR) structure of the data.
+
+        It is built from the loaded lines of sight if any (reading their
+        cell_buffer_index if it was skipped), and otherwise read from file,
+        and is cached.
+        """
+        if self._refinement is None:
+            from .columnar import _loaded
+
+            fields = ['R', 'cell_buffer_index']
+            if self.LOS:
+                plan = self.header._data_plan()
+                fields = _loaded(plan, self.LOS[0]) + fields
+            self._refinement = self.to_columnar(fields).refinement()
+        return self._refinement
+
+    def save(self, fname, version=None, byteorder=None, single=None):
+        """Write the data to fname, optionally in another version, byte order
+        or precision (see writer.write)."""
+        from .writer import write
+
+        write(fname, self, version, byteorder, single)
+
+    def verify(self):
+        """Check the structure of the file without reading its data.
+
+        Return an RTVerification, which is true if the file is consistent.
+        """
+        from .verify import verify
+
+        return verify(self.fname)
+
+    def _existing_index(self):
+        """Return the RTIndex for the current file if it has been built, or
+        is held in a valid sidecar, and None otherwise."""
+        from .index import RTIndex
+
+        if self._index is None and self.index_cache:
+            path = None if self.index_cache is True else self.index_cache
+            self._index = RTIndex.load(self.fname, path)
+        return self._index
+
+    def _set_index(self, offsets):
+        """Set the index from the offsets recorded while loading every LOS,
+        saving it to the sidecar if index_cache is set."""
+        from .index import RTIndex
+
+        N_LOS = len(self.LOS)
+        index = RTIndex(self.fname, self.header.version,
+                        np.array(offsets, dtype='i8'),
+                        np.fromiter((len(LOS) for LOS in self.LOS), 'i8',
+                                    N_LOS),
+                        np.fromiter((LOS.cell for LOS in self.LOS), 'i8',
+                                    N_LOS),
+                        np.fromiter((getattr(LOS, 'N_bytes', 0)
+                                     for LOS in self.LOS), 'i8', N_LOS))
+        index.header = self.header
+        self._index = index
+        if self.index_cache:
+            path = None if self.index_cache is True else self.index_cache
+            try:
+                index.save(path)
+            except (IOError, OSError):
+                pass
+
+    def get_index(self):
+        """Return the RTIndex for the current file, building it if needed."""
+        from .index import RTIndex
+
+        if self._index is None:
+            self._index = RTIndex.get(self.fname, self.index_cache)
+        return self._index
 
     def __getitem__(self, index):
-        """Get the ith line of sight.
+        """Get the ith line of sight, or a list of them for a slice.
 
-        Modifying the returned LOS will modify the LOS in RTData.
+        Modifying the returned LOS will modify the LOS in RTData, if all lines
+        of sight have been loaded. Otherwise, the lines of sight are read from
+        file.
         """
-        return self.LOS[index]
+        if self.LOS:
+            return self.LOS[index]
+
+        # Index first, as loading the header would consume a file object.
+        LOS_index = self.get_index()
+        if self.header._version is None:
+            self.header.load(self.mmap)
+        if isinstance(index, slice):
+            return [LOS_index.load_LOS(i, self.header, self.mmap)
+                    for i in range(len(LOS_index))[index]]
+        return LOS_index.load_LOS(index, self.header, self.mmap)
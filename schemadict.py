@@ -1,18 +1,184 @@
+from collections import OrderedDict
 from copy import deepcopy
 from itertools import product
 import sys
+if sys.version_info >= (3, 0):
+    from functools import reduce
 if sys.version_info < (3, 3):
     from collections import Mapping as ABCMapping
 else:
     from collections.abc import Mapping as ABCMapping
 
+import numpy as np
+
+from .readers import RTDataIOError
 from .schemas import _header_schemas, _data_schemas, _default_flags
 from .schemas import _MIN_RT_VER, _MAX_RT_VER
 
+# The most body dtypes cached by each read plan; the least recently used is
+# dropped beyond this.
+_MAX_BODIES = 64
+
+# The largest LOS which may be read as one record (NumPy's limit on the size
+# of a structured dtype).
+_MAX_RECORD_BYTES = 2**31 - 1
+
+def _rgetattr(x, name):
+    return reduce(getattr, [x] + name.split('.'))
+
+def _byteordered(dtype, byteorder):
+    dtype_str = np.dtype(dtype).str[1:] # Strip off byte order character.
+    return np.dtype(byteorder + dtype_str)
+
+def _structured_dtype(fields):
+    """Return a packed structured dtype for a list of (name, dtype, shape)."""
+    return np.dtype([(name, dtype, shape) for (name, dtype, shape) in fields])
+
 class RTSchemaException(Exception):
     def __init__(self, message):
         super(RTSchemaException, self).__init__(message)
 
+class _RTReadPlan(object):
+    """
+    A data schema compiled for one version, byte order and set of flags.
+
+    Contains the members
+        fields      A list of (name, dtype, count) for each block present in a
+                    LOS, in file order. dtype is fully resolved. count is an
+                    int, or the name of the attribute of the LOS holding it
+        prefix      The structured dtype of the leading blocks of fixed size
+                    (None if there are none)
+        counts      The names of the attributes which block counts depend on
+        cell_fields The names of stored blocks with one element per cell
+        los_fields  The names of stored blocks of fixed size
+        fixed       True if the size of a LOS is known from its header alone
+
+    The prefix is read first, to learn the counts of the remaining blocks. The
+    structured dtype of the remainder for a given set of counts is built once
+    and cached (for the most recently used _MAX_BODIES sets of counts), so a
+    whole LOS may be read with at most two reads. Counts which are negative,
+    or which give a LOS too large to read, raise RTDataIOError.
+    """
+
+    def __init__(self, fields):
+        super(_RTReadPlan, self).__init__()
+        self.fields = fields
+
+        n = 0
+        while n < len(fields) and not isinstance(fields[n][2], str):
+            n += 1
+        self._prefix = fields[:n]
+        self._body = fields[n:]
+        self.prefix = self._compile(self._prefix, {}) if n else None
+
+        self.counts = sorted(set(count for (_, _, count) in self._body
+                                 if isinstance(count, str)))
+        self.cell_fields = [name for (name, _, count) in fields
+                            if isinstance(count, str)
+                            and not name.startswith('_')]
+        self.los_fields = [name for (name, _, count) in fields
+                           if not isinstance(count, str)
+                           and not name.startswith('_')]
+        self.fixed = all(c.startswith('header.') for c in self.counts)
+        self._bodies = OrderedDict()
+
+    @staticmethod
+    def _compile(fields, counts):
+        size = _RTReadPlan._size(fields, counts)
+        if size is None or size > _MAX_RECORD_BYTES:
+            raise RTDataIOError("Invalid LOS block counts %s"
+                                % ', '.join("%s=%d" % (name, counts[name])
+                                            for name in sorted(counts)))
+        shaped = []
+        for (name, dtype, count) in fields:
+            if isinstance(count, str):
+                shape = (counts[count],)
+            else:
+                shape = () if count == 1 else (count,)
+            shaped.append((name, dtype, shape))
+        return _structured_dtype(shaped)
+
+    @staticmethod
+    def _size(fields, counts):
+        """Return the number of bytes of fields with counts, or None if any
+        count is negative."""
+        size = 0
+        for (_, dtype, count) in fields:
+            if isinstance(count, str):
+                count = counts[count]
+                if count < 0:
+                    return None
+            size += dtype.itemsize * count
+        return size
+
+    def body(self, LOS):
+        """Return the structured dtype of the blocks following the prefix.
+
+        Counts are resolved against LOS, which must already hold the prefix.
+        """
+        return self.body_for(tuple(int(_rgetattr(LOS, count))
+                                   for count in self.counts))
+
+    def body_for(self, values):
+        """As body, but for a tuple of count values ordered as counts."""
+        try:
+            # Move the dtype to the most recently used end.
+            dtype = self._bodies.pop(values)
+        except KeyError:
+            dtype = self._compile(self._body, dict(zip(self.counts, values)))
+            if len(self._bodies) >= _MAX_BODIES:
+                self._bodies.popitem(last=False)
+        self._bodies[values] = dtype
+        return dtype
+
+    def body_size(self, values):
+        """Return the number of bytes of the blocks following the prefix for a
+        tuple of count values ordered as counts, or None if any count is
+        negative. No dtype is built, so any values may be given."""
+        return self._size(self._body, dict(zip(self.counts, values)))
+
+    def conversions(self, dtypes):
+        """Return a dict of block name to target dtype under dtypes.
+
+        dtypes maps block names, or the groups 'float' and 'int', to a target
+        dtype; a name mapped to None is left as stored, whatever its group.
+        Any other value is taken as the target dtype of the 'float' group.
+        Only array blocks whose dtype would change are included, and targets
+        are native-endian.
+        """
+        if not dtypes:
+            return {}
+        if not isinstance(dtypes, dict):
+            dtypes = {'float': dtypes}
+
+        conversions = {}
+        for (name, dtype, count) in self.fields:
+            if count == 1 or name.startswith('_'):
+                continue
+            if name in dtypes:
+                target = dtypes[name]
+            elif dtype.kind == 'f':
+                target = dtypes.get('float')
+            elif dtype.kind in 'iu':
+                target = dtypes.get('int')
+            else:
+                target = None
+            if target is None:
+                continue
+            target = np.dtype(target).newbyteorder('=')
+            if target != dtype:
+                conversions[name] = target
+        return conversions
+
+    def dtype(self, LOS):
+        """Return the structured dtype of a whole LOS.
+
+        Only possible before the prefix is read if the plan is fixed.
+        """
+        fields = self._prefix + self._body
+        key = tuple(int(_rgetattr(LOS, count)) for count in self.counts)
+        return self._compile(fields, dict(zip(self.counts, key)))
+
 class _RTSchemaDict(ABCMapping):
     def __init__(self):
         self._versions = set()
@@ -20,6 +186,10 @@ class _RTSchemaDict(ABCMapping):
         self._data_schemas = _data_schemas
         self._default_flags = _default_flags
 
+        self._plans = {}
+        self._header_dtypes = {}
+        self._flag_names = {}
+
         self._set_all_versions()
         self._fill_missing_schemas()
 
@@ -63,6 +233,79 @@ class _RTSchemaDict(ABCMapping):
         for key in self.iterkeys():
             yield key, self[key]
 
+    def header_dtype(self, key, byteorder):
+        """Return the structured dtype of the header of version key."""
+        try:
+            return self._header_dtypes[(key, byteorder)]
+        except KeyError:
+            pass
+
+        fields = []
+        for (name, (dtype, count)) in self._header_schemas[key].items():
+            shape = () if count == 1 else (count,)
+            fields.append((name, _byteordered(dtype, byteorder), shape))
+        dtype = _structured_dtype(fields)
+        self._header_dtypes[(key, byteorder)] = dtype
+        return dtype
+
+    def plan_flags(self, key):
+        """Return the names of the header flags the data of version key
+        depends on."""
+        try:
+            return self._flag_names[key]
+        except KeyError:
+            pass
+
+        flags = set()
+        for fmt in self._data_schemas[key].values():
+            if fmt[0] == 'f':
+                flags.add('flag_single')
+            if len(fmt) == 3 and isinstance(fmt[2], str):
+                flags.add(self._header_attr(fmt[2]))
+        self._flag_names[key] = tuple(sorted(flags))
+        return self._flag_names[key]
+
+    @staticmethod
+    def _header_attr(name):
+        if not name.startswith('header.'):
+            raise RTSchemaException("Flag " + name + " is not a header attribute")
+        return name[len('header.'):]
+
+    def plan(self, key, byteorder, header):
+        """Return the read plan for LOS data of version key.
+
+        Flags are taken from header. Plans are compiled once for each
+        combination of version, byte order and flag values.
+        """
+        flags = tuple((name, bool(getattr(header, name)))
+                      for name in self.plan_flags(key))
+        try:
+            return self._plans[(key, byteorder, flags)]
+        except KeyError:
+            pass
+
+        values = dict(flags)
+        fields = []
+        for (name, fmt) in self._data_schemas[key].items():
+            if len(fmt) == 2:
+                dtype, count = fmt
+                flag = True
+            else:
+                dtype, count, flag = fmt
+
+            if isinstance(flag, str):
+                flag = values[self._header_attr(flag)]
+            if not flag:
+                continue
+
+            if dtype == 'f':
+                dtype = 'f4' if values['flag_single'] else 'f8'
+            fields.append((name, _byteordered(dtype, byteorder), count))
+
+        plan = _RTReadPlan(fields)
+        self._plans[(key, byteorder, flags)] = plan
+        return plan
+
     def _fill_missing_schemas(self):
         schemas = [self._header_schemas, self._data_schemas, self._default_flags]
         for (dct, target_version) in product(schemas, self._versions):
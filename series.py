@@ -0,0 +1,399 @@
+from functools import reduce as _reduce
+from glob import glob
+import hashlib
+import os
+
+import numpy as np
+
+from .index import RTIndex, _file_stat
+from .readers import _open_reader
+from .rtdata import RTData, RTHeader, RTLOS
+
+# Bump when the layout of track cache files changes.
+_TRACK_FORMAT = 1
+
+# Header values recorded for each snapshot of a track.
+_TRACK_HEADER = ('time', 'redshift', 'expansion_factor')
+
+# Marks an unset initial value, since None is a valid one.
+_NOTHING = object()
+
+class RTSeries(object):
+    """
+    A series of RT snapshot files.
+
+    Contains the members
+        fnames The list of file names in the series
+
+    A series is created from a list of file names, or a glob pattern (in
+    which case the matching files are sorted by name):
+        s = RTSeries('run/rt_*.dat')
+        s[0]  # An (unloaded) RTData for the first snapshot
+
+    Functions are mapped over snapshots, or over every line of sight of every
+    snapshot, with a pool of worker processes. Results may be combined with a
+    reducer, a function of two results returning their combination (e.g.
+    operator.add). When mapping over lines of sight, each worker reduces the
+    results for its own snapshot, so only one value per snapshot is sent back
+    to the parent process:
+        def neutral_mass(LOS):
+            return (LOS.D * LOS.x_H1 * LOS.R**2).sum()
+        total = s.map(neutral_mass, reduce=operator.add, per='LOS',
+                      fields=['R', 'D', 'x_H1'])
+
+    Functions and reducers must be picklable, i.e. defined at the top level of
+    a module, unless processes is 1.
+
+    Chosen fields of chosen lines of sight are extracted from every snapshot
+    with extract, reading only their blocks, and stacked through time:
+        track = s.extract(['R', 'x_H1'], LOS=[10, 250], cache='run/tracks')
+        track.get('x_H1', 10)  # (snapshot x cell) array for LOS 10
+
+    Contains the methods
+        map     Map a function over the series, returning all (reduced)
+                results
+        imap    Map a function over the series, yielding (fname, result) pairs
+        extract Extract fields of some lines of sight from every snapshot, as
+                an RTTrack
+    """
+
+    def __init__(self, fnames):
+        super(RTSeries, self).__init__()
+        if isinstance(fnames, str):
+            fnames = sorted(glob(fnames))
+        self.fnames = list(fnames)
+
+    def __len__(self):
+        return len(self.fnames)
+
+    def __getitem__(self, i):
+        return RTData(self.fnames[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def imap(self, func, reduce=None, initial=_NOTHING, per='snapshot',
+             fields=None, mmap=False, processes=None, max_in_flight=None,
+             ordered=True):
+        """Map func over the series, yielding (fname, result) pairs.
+
+        If per is 'snapshot', func is called with each loaded RTData. If per is
+        'LOS', func is called with each RTLOS in turn, and the results for a
+        snapshot are combined with reduce (starting from initial, if given) in
+        the worker; without a reducer, the result for a snapshot is a list.
+        As initial starts the reduction of every snapshot, it should be an
+        identity for reduce (e.g. 0 for operator.add). fields and mmap are as
+        for RTData.
+
+        At most processes worker processes are used (default: one per CPU),
+        with at most max_in_flight snapshots submitted but not yet yielded
+        (default: twice the number of processes). If processes is 1, func is
+        called in this process. If ordered is False, results are yielded as
+        soon as they are ready rather than in the order of the series.
+        """
+        if per not in ('snapshot', 'LOS'):
+            raise ValueError("per must be 'snapshot' or 'LOS'")
+        # Pass the initial value as a tuple, as _NOTHING does not survive
+        # pickling.
+        initial = () if initial is _NOTHING else (initial,)
+        args = (func, reduce, initial, per, fields, mmap)
+
+        if processes == 1:
+            for fname in self.fnames:
+                yield fname, _apply(fname, *args)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor, wait
+        from concurrent.futures import FIRST_COMPLETED
+
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if max_in_flight is None:
+            max_in_flight = 2 * processes
+
+        with ProcessPoolExecutor(processes) as pool:
+            pending = {}
+            done = {}
+            submitted = 0
+            next_out = 0
+            while next_out < len(self.fnames):
+                while submitted < len(self.fnames) and \
+                        len(pending) + len(done) < max_in_flight:
+                    fname = self.fnames[submitted]
+                    future = pool.submit(_apply, fname, *args)
+                    pending[future] = submitted
+                    submitted += 1
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done[pending.pop(future)] = future.result()
+
+                if ordered:
+                    while next_out in done:
+                        yield self.fnames[next_out], done.pop(next_out)
+                        next_out += 1
+                else:
+                    for i in list(done):
+                        yield self.fnames[i], done.pop(i)
+                        next_out += 1
+
+    def map(self, func, reduce=None, initial=_NOTHING, **kwargs):
+        """Map func over the series.
+
+        Return the list of per-snapshot results or, if reduce is given, their
+        combination. Arguments are as for imap.
+        """
+        results = (result for (_, result) in
+                   self.imap(func, reduce, initial, **kwargs))
+        if reduce is None:
+            return list(results)
+        initial = () if initial is _NOTHING else (initial,)
+        return _reduce(reduce, results, *initial)
+
+    def extract(self, fields, LOS, cache=None, index_cache=False):
+        """Extract fields of the lines of sight LOS from every snapshot.
+
+        Return an RTTrack. Each snapshot is read through its RTIndex (see
+        index_cache, as for RTData), seeking to each wanted LOS and reading
+        only its single-valued words and the blocks named in fields.
+
+        If cache is a directory name, the values extracted from each snapshot
+        are saved there, and reused while the size and modification time of
+        the snapshot are unchanged. Extracting again after new snapshots have
+        been added to the series reads only the new snapshots. Entries are
+        specific to the set of fields and LOS. Failure to write the cache is
+        not an error.
+        """
+        fields = list(fields)
+        LOS = [int(i) for i in np.atleast_1d(LOS)]
+        if cache is not None and not os.path.isdir(cache):
+            try:
+                os.makedirs(cache)
+            except (IOError, OSError):
+                cache = None
+
+        snapshots = []
+        for fname in self.fnames:
+            values = None
+            path = None
+            if cache is not None:
+                path = _track_name(cache, fname, fields, LOS)
+                values = _read_track(path, fname)
+            if values is None:
+                values = _extract(fname, fields, LOS, index_cache)
+                if path is not None:
+                    try:
+                        _write_track(path, fname, values)
+                    except (IOError, OSError):
+                        pass
+            snapshots.append(values)
+        return RTTrack(self.fnames, fields, LOS, snapshots)
+
+class RTTrack(object):
+    """
+    Fields of some lines of sight, through the snapshots of an RTSeries.
+
+    Contains the members
+        fnames  The snapshot file names, in order
+        fields  The names of the fields extracted
+        LOS     The indices of the lines of sight extracted
+        N_cells The number of cells of each LOS in each snapshot, -1 where a
+                snapshot has no such LOS (N_snapshots x N_LOS)
+        time, redshift, expansion_factor
+                The header values of each snapshot; NaN for versions without
+                them
+
+    Values are stacked through time, one row per snapshot, with get (or by
+    indexing with the index of a LOS, for a dict of every field):
+        track.get('x_H1', 10)  # N_snapshots x N_cells array
+        track[10]['x_H1']      # Equivalent
+    Per-cell fields have as many columns as the most cells of the LOS in any
+    snapshot; shorter rows are padded with NaN, or -1 for integer fields
+    (which are returned as int64).
+    Single-valued fields (cell, N_bytes) have one element per snapshot, and
+    other per-LOS fields (Ncols) one row. Fields not present in the version of
+    a snapshot are padded likewise.
+    """
+
+    def __init__(self, fnames, fields, LOS, snapshots):
+        super(RTTrack, self).__init__()
+        self.fnames = list(fnames)
+        self.fields = list(fields)
+        self.LOS = list(LOS)
+        self._snapshots = snapshots
+        self._stacked = {}
+        self.N_cells = np.array([s['N_cells'] for s in snapshots],
+                                dtype='i8').reshape(len(snapshots),
+                                                    len(self.LOS))
+        for name in _TRACK_HEADER:
+            setattr(self, name, np.array([s[name] for s in snapshots],
+                                         dtype='f8'))
+
+    def __len__(self):
+        return len(self.fnames)
+
+    def __getitem__(self, LOS):
+        return dict((name, self.get(name, LOS)) for name in self.fields)
+
+    def get(self, name, LOS):
+        """Return field name of LOS (the index of a LOS in each snapshot)
+        through time, one row per snapshot."""
+        j = self.LOS.index(LOS)
+        key = (name, j)
+        if key not in self._stacked:
+            self._stacked[key] = self._stack(name, j)
+        return self._stacked[key]
+
+    def _stack(self, name, j):
+        rows = [s['fields'].get(name, (None, None)) for s in self._snapshots]
+        present = [(values, offsets) for (values, offsets) in rows
+                   if values is not None]
+        if not present:
+            raise KeyError("Field %s is not present in any snapshot" % name)
+        dtypes = [values.dtype for (values, _) in present]
+        if all(dtype.kind in 'iu' for dtype in dtypes):
+            # Mixed signed and unsigned words (cell, N_bytes) promote to
+            # float64 in numpy, but are small enough for int64.
+            dtype = np.dtype('i8')
+            fill = -1
+        else:
+            dtype = np.result_type(np.result_type(*dtypes), 'f4')
+            fill = np.nan
+
+        if present[0][1] is None:
+            # One value, or one fixed-size row, per LOS.
+            shape = present[0][0].shape[1:]
+            out = np.full((len(rows),) + shape, fill, dtype=dtype)
+            for (k, (values, _)) in enumerate(rows):
+                if values is not None and self.N_cells[k, j] >= 0:
+                    out[k] = values[j]
+            return out
+
+        width = max(int(self.N_cells[:, j].max()), 0) if len(rows) else 0
+        out = np.full((len(rows), width), fill, dtype=dtype)
+        for (k, (values, offsets)) in enumerate(rows):
+            if values is not None:
+                cells = values[offsets[j]:offsets[j + 1]]
+                out[k, :len(cells)] = cells
+        return out
+
+def _extract(fname, fields, LOS, index_cache):
+    """Read fields of the lines of sight LOS from the snapshot fname.
+
+    Return a dict of 'N_cells' (one per LOS, -1 where missing), the header
+    values of _TRACK_HEADER, and 'fields', a dict of field name to (values,
+    offsets). Per-cell values are concatenated over the LOS, with offsets in
+    the style of RTColumnar; per-LOS values have one row per LOS and offsets
+    None.
+    """
+    index = RTIndex.get(fname, index_cache)
+    header = getattr(index, 'header', None)
+    if header is None:
+        header = RTHeader(fname)
+        header.load()
+    plan = header._data_plan()
+    cell_fields = [name for name in fields if name in plan.cell_fields]
+    los_fields = [name for name in fields if name in plan.los_fields]
+
+    N_cells = np.full(len(LOS), -1, dtype='i8')
+    cells = dict((name, []) for name in cell_fields)
+    rows = dict((name, []) for name in los_fields)
+    with _open_reader(fname) as f:
+        for (j, i) in enumerate(LOS):
+            if not 0 <= i < len(index):
+                for name in los_fields:
+                    rows[name].append(None)
+                continue
+            f.seek(int(index.offsets[i]))
+            data = RTLOS(header)
+            data._load(f, fields)
+            N_cells[j] = len(data)
+            for name in cell_fields:
+                cells[name].append(getattr(data, name))
+            for name in los_fields:
+                rows[name].append(getattr(data, name))
+
+    values = {}
+    offsets = np.zeros(len(LOS) + 1, dtype='i8')
+    np.cumsum(np.maximum(N_cells, 0), out=offsets[1:])
+    for name in cell_fields:
+        if cells[name]:
+            column = np.concatenate(cells[name])
+            column = column.astype(_native(column.dtype))
+        else:
+            column = np.empty(0, dtype='f8')
+        values[name] = (column, offsets)
+    for name in los_fields:
+        present = [row for row in rows[name] if row is not None]
+        if not present:
+            continue
+        example = np.asarray(present[0])
+        row = np.zeros(example.shape, dtype=_native(example.dtype))
+        values[name] = (np.array([row if r is None else r
+                                  for r in rows[name]],
+                                 dtype=row.dtype), None)
+
+    result = {'N_cells': N_cells, 'fields': values}
+    for name in _TRACK_HEADER:
+        result[name] = float(getattr(header, name, np.nan))
+    return result
+
+def _native(dtype):
+    return dtype.newbyteorder('=')
+
+def _track_name(cache, fname, fields, LOS):
+    """Return the name of the cache file of fields of LOS from fname."""
+    key = repr((os.path.abspath(fname), sorted(fields), LOS))
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache, "%s.%s.rttrack.npz"
+                        % (os.path.basename(fname), digest))
+
+def _write_track(path, fname, values):
+    size, mtime = _file_stat(fname)
+    arrays = dict(format=_TRACK_FORMAT, size=size, mtime=mtime,
+                  N_cells=values['N_cells'])
+    for name in _TRACK_HEADER:
+        arrays['header_' + name] = values[name]
+    for (name, (data, offsets)) in values['fields'].items():
+        arrays['values_' + name] = data
+        if offsets is not None:
+            arrays['offsets_' + name] = offsets
+    # Write to a temporary file first, so a partial file is never read.
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, **arrays)
+    os.rename(temporary, path)
+
+def _read_track(path, fname):
+    """Return the values cached in path, or None if missing, of an unknown
+    format, or out of date with respect to fname."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if int(data['format']) != _TRACK_FORMAT:
+            return None
+        if (int(data['size']), float(data['mtime'])) != _file_stat(fname):
+            return None
+        values = {'N_cells': data['N_cells'], 'fields': {}}
+        for name in _TRACK_HEADER:
+            values[name] = float(data['header_' + name])
+        for key in data.files:
+            if key.startswith('values_'):
+                name = key[len('values_'):]
+                offsets = data['offsets_' + name] \
+                    if 'offsets_' + name in data.files else None
+                values['fields'][name] = (data[key], offsets)
+    return values
+
+def _apply(fname, func, reduce, initial, per, fields, mmap):
+    """Apply func to a snapshot, or its lines of sight, in a worker."""
+    data = RTData(fname, mmap=mmap)
+    if per == 'snapshot':
+        data.load(fields)
+        return func(data)
+
+    results = (func(LOS) for LOS in data.iter_los(fields=fields))
+    if reduce is None:
+        return list(results)
+    return _reduce(reduce, results, *initial)
@@ -0,0 +1,172 @@
+import numpy as np
+
+from .columnar import RTColumnar
+
+# Alignment of each block within a segment.
+_ALIGN = 64
+
+class RTSharedHandle(object):
+    """
+    A small, picklable description of an RTColumnar in shared memory.
+
+    Contains the members
+        name   The name of the shared memory segment
+        header The RT header (RTHeader) of the data
+        blocks A list of (name, dtype string, shape, offset) of each array in
+               the segment
+
+    Pass a handle to worker processes, and attach to it there with
+    RTShared.attach.
+    """
+
+    def __init__(self, name, header, blocks):
+        super(RTSharedHandle, self).__init__()
+        self.name = name
+        self.header = header
+        self.blocks = blocks
+
+class RTShared(object):
+    """
+    An RTColumnar held in a shared memory segment, for use by many processes.
+
+    Contains the members
+        columnar The RTColumnar, whose columns are views into the segment
+        handle   The RTSharedHandle used to attach to the segment
+        owner    True if this process created the segment
+
+    A snapshot is loaded once into a single segment, and worker processes
+    attach to it without copying. Pickling an RTShared sends only its handle,
+    and unpickling attaches, so it may be passed directly as a task argument:
+        with RTShared.publish(fname, fields=['R', 'T']) as shared:
+            with ProcessPoolExecutor() as pool:
+                results = list(pool.map(analyse, [shared] * 8, range(8)))
+    where analyse(shared, i) uses shared.columnar.
+
+    The lifetime of the segment is explicit. Each process closes its own
+    attachment with close, after dropping any references to the column
+    arrays; the owner removes the segment with unlink once all processes are
+    done. Used as a context manager, an RTShared is closed (and, if it is the
+    owner, unlinked) on exit. Attaching does not take ownership, so a worker
+    exiting never removes the segment.
+
+    Contains the methods
+        publish Create a segment holding an RTColumnar (a class method)
+        attach  Attach to an existing segment from its handle (a class method)
+        close   Close this process's attachment to the segment
+        unlink  Remove the segment
+    """
+
+    def __init__(self, handle, segment, owner):
+        super(RTShared, self).__init__()
+        self.handle = handle
+        self.owner = owner
+        self._segment = segment
+
+        arrays = {}
+        for (name, dtype, shape, offset) in handle.blocks:
+            arrays[name] = np.ndarray(shape, np.dtype(dtype), segment.buf,
+                                      offset)
+        offsets = arrays.pop('_offsets')
+        self.columnar = RTColumnar(handle.header, offsets, arrays)
+
+    @classmethod
+    def publish(cls, data, fields=None, name=None):
+        """Copy data into a new shared memory segment.
+
+        data is an RTColumnar, an RTData (see RTData.to_columnar), or the name
+        of an RT data file, which is read directly into columns. If fields is
+        not None, only the named fields are published. name is the name of the
+        segment; by default a unique name is chosen.
+        """
+        shared_memory = _shared_memory()
+        if not isinstance(data, RTColumnar):
+            if hasattr(data, 'to_columnar'):
+                data = data.to_columnar(fields)
+            else:
+                data = RTColumnar.from_file(data, fields)
+        columns = [('_offsets', data.offsets)]
+        columns += sorted((key, column) for (key, column) in data.columns.items()
+                          if fields is None or key in fields)
+
+        blocks = []
+        size = 0
+        for (key, column) in columns:
+            blocks.append((key, column.dtype.str, column.shape, size))
+            size = _aligned(size + column.nbytes)
+
+        # Segments may not be empty.
+        segment = shared_memory.SharedMemory(name, create=True,
+                                             size=max(size, 1))
+        try:
+            for ((_, column), (key, dtype, shape, offset)) in zip(columns,
+                                                                  blocks):
+                view = np.ndarray(shape, np.dtype(dtype), segment.buf, offset)
+                view[...] = column
+                del view
+            handle = RTSharedHandle(segment.name, data.header, blocks)
+            return cls(handle, segment, True)
+        except Exception:
+            segment.close()
+            segment.unlink()
+            raise
+
+    @classmethod
+    def attach(cls, handle):
+        """Attach to the segment described by handle."""
+        shared_memory = _shared_memory()
+        try:
+            segment = shared_memory.SharedMemory(handle.name, track=False)
+        except TypeError:
+            # Before Python 3.13, attaching registers the segment for removal
+            # when the process exits; only the owner should remove it.
+            from multiprocessing import resource_tracker
+
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                segment = shared_memory.SharedMemory(handle.name)
+            finally:
+                resource_tracker.register = register
+        return cls(handle, segment, False)
+
+    def __reduce__(self):
+        return (RTShared.attach, (self.handle,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        if self.owner:
+            self.unlink()
+
+    def close(self):
+        """Close this process's attachment to the segment.
+
+        The columnar data is no longer available. Raises BufferError if other
+        references to its arrays remain.
+        """
+        if self._segment is None:
+            return
+        self.columnar = None
+        self._segment.close()
+        if not self.owner:
+            self._segment = None
+
+    def unlink(self):
+        """Remove the segment. It is freed once every process has closed it."""
+        if not self.owner:
+            raise ValueError("Only the owner of a segment may unlink it")
+        if self._segment is not None:
+            self._segment.unlink()
+            self._segment = None
+
+def _shared_memory():
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise ImportError("Shared memory requires Python 3.8 or later")
+    return shared_memory
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
@@ -0,0 +1,190 @@
+import itertools
+import os
+
+import numpy as np
+
+from .rtdata import RTHeader, RTLOS
+from .schemadict import schema_dict
+from .writer import _WRITE_BYTES, _RTWriter
+
+# The flags stored in the headers of versions >= 3.9 which select optional
+# blocks, as the keyword arguments of generate.
+_FLAGS = (('rates', 'flag_rates'),
+          ('velocities', 'flag_velocities'),
+          ('Ncols', 'flag_Ncols'),
+          ('refinements', 'flag_refinements'))
+
+# Proton mass, kg.
+_m_p = 1.6726e-27
+
+def generate(fname, N_LOS, N_cells, version='3.15', byteorder='=',
+             single=False, rates=True, velocities=True, Ncols=True,
+             refinements=True, seed=None):
+    """Write a synthetic RT file of N_LOS lines of sight to fname.
+
+    N_cells is the number of cells of each LOS, or a pair (low, high) from
+    which the number of each is drawn uniformly (high inclusive); version 2.3
+    requires a single number. version is a string 'x.y' of any version in
+    schema_dict, and byteorder '<', '>' or '='. single, rates, velocities,
+    Ncols and refinements set the corresponding header flags; they are
+    ignored for versions whose header does not hold them, which have a fixed
+    set of blocks.
+
+    Values are random but consistent: R increases along each LOS, with dR
+    the cell widths, ionization fractions of each species sum to one, number
+    densities follow from D, and no cell is refined (cell_buffer_index is -1).
+    The file is written in blocks, so files larger than memory may be made.
+    Returns the RTHeader of the file written.
+    """
+    rng = np.random.default_rng(seed)
+    key = "%02d%02d" % tuple(int(v) for v in version.split('.'))
+    if key not in schema_dict:
+        raise ValueError("Unsupported RT file version " + version)
+    if np.ndim(N_cells) == 0:
+        low = high = int(N_cells)
+    else:
+        (low, high) = (int(n) for n in N_cells)
+    if low < 0 or high < low:
+        raise ValueError("Invalid N_cells %r" % (N_cells,))
+
+    source = RTHeader(fname)
+    source._version_key = key
+    source._version = (int(key[:2]), int(key[2:]))
+    source._byteorder = byteorder
+    header_schema, flags, _ = schema_dict[key]
+    for (name, value) in flags.items():
+        setattr(source, name, value)
+    options = dict(rates=rates, velocities=velocities, Ncols=Ncols,
+                   refinements=refinements)
+    for (option, name) in _FLAGS:
+        if name in header_schema:
+            setattr(source, name, int(bool(options[option])))
+    if 'flag_single' in header_schema:
+        source.flag_single = int(bool(single))
+    source.expansion_factor = 0.1
+    source.redshift = 9.0
+    source.time = 1.6e16
+    source.N_cells = high
+
+    with open(fname, 'wb') as f:
+        writer = _RTWriter(f, None, None, None)
+        writer.begin(source)
+        plan = writer.plan
+        if plan.fixed and low != high:
+            raise ValueError("Every LOS must have the same number of cells "
+                             "in version " + version)
+
+        LOS = RTLOS(writer.header)
+        LOS.N_cells = high
+        per_LOS = max(plan.dtype(LOS).itemsize, 1)
+        chunk = max(1, _WRITE_BYTES // per_LOS)
+        for start in range(0, N_LOS, chunk):
+            count = min(chunk, N_LOS - start)
+            sizes = rng.integers(low, high + 1, count)
+            for (n, records) in _records(writer, sizes, start, rng):
+                writer._append(records, n)
+        writer.end()
+    return writer.header
+
+def generate_all(directory, N_LOS, N_cells, seed=None):
+    """Write a synthetic file for every supported combination of version,
+    byte order, precision and optional blocks to directory.
+
+    Versions whose header holds no flags are written once per byte order.
+    N_cells is as for generate; versions requiring a fixed number of cells
+    use the larger, if a pair is given. Returns a list of (fname, settings)
+    for each file, where settings is a dict of the arguments to generate.
+    """
+    written = []
+    for (settings, name) in _combinations():
+        fname = os.path.join(directory, name + '.bin')
+        cells = N_cells
+        if np.ndim(N_cells) and settings['version'] == '2.3':
+            cells = int(N_cells[1])
+        generate(fname, N_LOS, cells, seed=seed, **settings)
+        written.append((fname, settings))
+    return written
+
+def _combinations():
+    """Yield (settings, name) for each distinct kind of file."""
+    for key in sorted(schema_dict.keys()):
+        version = "%d.%d" % (int(key[:2]), int(key[2:]))
+        header_schema = schema_dict[key][0]
+        options = [option for (option, name) in _FLAGS
+                   if name in header_schema]
+        precisions = [False, True] if 'flag_single' in header_schema \
+            else [False]
+        for byteorder in ('<', '>'):
+            for single in precisions:
+                for values in itertools.product((True, False),
+                                                repeat=len(options)):
+                    settings = dict(version=version, byteorder=byteorder,
+                                    single=single)
+                    settings.update(zip(options, values))
+                    name = "rt_%s_%s%s" % (key, 'le' if byteorder == '<'
+                                           else 'be',
+                                           '_single' if single else '')
+                    for (option, value) in zip(options, values):
+                        if not value:
+                            name += '_no' + option
+                    yield (settings, name)
+
+def _records(writer, sizes, start, rng):
+    """Yield (N_cells, records) of consecutive runs of LOS, the first of
+    which is the start'th in the file, with N_cells given by sizes."""
+    plan = writer.plan
+    LOS = RTLOS(writer.header)
+    # Runs of equal size share one structured array.
+    breaks = np.nonzero(np.diff(sizes))[0] + 1
+    for (lo, hi) in zip(np.concatenate([[0], breaks]),
+                        np.concatenate([breaks, [len(sizes)]])):
+        n = int(sizes[lo])
+        LOS.N_cells = n
+        records = np.zeros(hi - lo, dtype=plan.dtype(LOS))
+        _fill(records, plan, LOS, n, start + lo, rng)
+        yield (n, records)
+
+def _fill(records, plan, LOS, n, first, rng):
+    """Fill records, each a LOS of n cells, with random consistent values."""
+    count = len(records)
+    shape = (count, n)
+
+    dR = rng.uniform(0.5, 1.5, shape) * 3.086e19
+    R = np.cumsum(dR, axis=1)
+    D = 10 ** rng.uniform(-27, -23, shape)
+    n_H = 0.76 * D / _m_p
+    n_He = 0.24 * D / (4 * _m_p)
+    x_H1 = rng.random(shape)
+    x_He = rng.dirichlet((1, 1, 1), shape)
+    x_He = [x_He[..., 0], x_He[..., 1], x_He[..., 2]]
+    values = {
+        'R': R,
+        'dR': dR,
+        'D': D,
+        'Dold': D,
+        'T': 10 ** rng.uniform(2, 5, shape),
+        'n_H': n_H,
+        'n_He': n_He,
+        'n': n_H + n_He,
+        'x_H1': x_H1,
+        'x_H2': 1 - x_H1,
+        'x_He1': x_He[0],
+        'x_He2': x_He[1],
+        'x_He3': x_He[2],
+        'Ncol_H1': np.cumsum(n_H * x_H1 * dR, axis=1),
+        'Ncol_He1': np.cumsum(n_He * x_He[0] * dR, axis=1),
+        'Ncol_He2': np.cumsum(n_He * x_He[1] * dR, axis=1),
+        'tau_H1': np.cumsum(6.3e-22 * n_H * x_H1 * dR, axis=1),
+        'cell_buffer_index': -1,
+    }
+    for (name, dtype, size) in plan.fields:
+        if name in ('N_cells', '_N_cells'):
+            records[name] = n
+        elif name == 'cell':
+            records[name] = np.arange(first, first + count)
+        elif name == 'N_bytes':
+            records[name] = plan.body(LOS).itemsize
+        elif name in values:
+            records[name] = values[name]
+        elif dtype.kind == 'f':
+            records[name] = rng.random(records[name].shape)
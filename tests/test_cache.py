@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from .. import RTColumnar, get_cache, read_cache, write_cache
+from ..cache import cache_name
+from ..synthetic import generate
+
+class TestCache(unittest.TestCase):
+    """Cache files reload the columnar layout, and only while valid."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+        generate(self.fname, 7, (0, 6), '3.15', seed=40)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _assert_equal(self, a, b):
+        self.assertEqual(sorted(a.columns), sorted(b.columns))
+        self.assertTrue(np.array_equal(a.offsets, b.offsets))
+        for name in a.columns:
+            self.assertTrue(np.array_equal(a.columns[name], b.columns[name]),
+                            name)
+
+    def test_round_trip(self):
+        data = get_cache(self.fname)
+        self.assertTrue(os.path.exists(cache_name(self.fname)))
+        self._assert_equal(data, RTColumnar.from_file(self.fname))
+        self.assertEqual(data.header.N_LOS, 7)
+
+    def test_fields(self):
+        data = get_cache(self.fname, fields=['R', 'T'])
+        self.assertEqual(sorted(data.columns), ['R', 'T'])
+        # A cache lacking wanted fields is written again.
+        data = get_cache(self.fname, fields=['R', 'T', 'n_H'])
+        self.assertIn('n_H', data.columns)
+
+    def test_stale(self):
+        cache_fname = write_cache(self.fname)
+        self.assertIsNotNone(read_cache(cache_fname, self.fname))
+
+        generate(self.fname, 4, (0, 6), '3.15', seed=41)
+        self.assertIsNone(read_cache(cache_fname, self.fname))
+        self._assert_equal(get_cache(self.fname),
+                           RTColumnar.from_file(self.fname))
+
+        st = os.stat(self.fname)
+        os.utime(self.fname, (st.st_atime, st.st_mtime + 10))
+        self.assertIsNone(read_cache(cache_fname, self.fname))
+
+if __name__ == '__main__':
+    unittest.main()
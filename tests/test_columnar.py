@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..columnar import RTColumnar
+from ..synthetic import generate
+
+class TestInterp(unittest.TestCase):
+    """interp matches np.interp along each LOS."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        fname = os.path.join(self.directory, 'rt.bin')
+        generate(fname, 6, (0, 7), seed=10)
+        self.data = RTColumnar.from_file(fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_interp(self):
+        c = self.data
+        R_max = c.columns['R'].max()
+        radii = np.concatenate([np.linspace(0, 1.2 * R_max, 50),
+                                c.columns['R']])
+        for (left, right) in ((None, None), (-1.0, -2.0)):
+            found = c.interp('T', radii, left=left, right=right)
+            for i in range(len(c)):
+                R = c.columns['R'][c.los_slice(i)]
+                T = c.columns['T'][c.los_slice(i)]
+                if not len(R):
+                    self.assertTrue(np.isnan(found[i]).all())
+                    continue
+                expected = np.interp(radii, R, T, left, right)
+                self.assertTrue(np.allclose(found[i], expected), i)
+
+    def test_last_radius(self):
+        # A radius equal to the last R of a LOS is inside it.
+        c = self.data
+        for i in np.nonzero(c.N_cells)[0]:
+            cells = c.los_slice(i)
+            found = c.interp('T', [c.columns['R'][cells][-1]], right=-2.0)
+            self.assertEqual(found[i, 0], c.columns['T'][cells][-1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import gc
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import weakref
+
+import numpy as np
+
+from .. import RTData, RTProfile, derived
+from ..synthetic import generate
+
+class TestDerived(unittest.TestCase):
+    """Derived quantities are cached, and recomputed when sources change."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+        generate(self.fname, 4, (2, 6), '3.15', seed=14)
+        self.data = RTData(self.fname)
+        self.data.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cached(self):
+        LOS = self.data.LOS[0]
+        self.assertIs(LOS.n_e, LOS.n_e)
+        self.assertTrue(np.allclose(LOS.volume,
+                                    4 * np.pi * LOS.R ** 2 * LOS.dR))
+
+    def test_setitem(self):
+        LOS = self.data.LOS[0]
+        volume = LOS.volume.copy()
+        cells = LOS.cells(slice(0, 1), ['R'])
+        cells['R'] *= 2
+        LOS[0:1] = cells
+        self.assertEqual(LOS.volume[0], 4 * volume[0])
+        self.assertTrue(np.array_equal(LOS.volume[1:], volume[1:]))
+
+    def test_replaced(self):
+        LOS = self.data.LOS[0]
+        volume = LOS.volume
+        R = weakref.ref(LOS.R)
+        LOS.R = LOS.R * 2
+        gc.collect()
+        # The cached value does not keep the replaced source alive.
+        self.assertIsNone(R())
+        self.assertTrue(np.allclose(LOS.volume, 4 * volume))
+
+    def test_evicted_source(self):
+        # dR is derived where it is not loaded. Evicting it, the least
+        # recently used, frees it although volume, computed from it, is
+        # still cached; volume is then recomputed.
+        d = RTData(self.fname)
+        d.load(fields=['R'])
+        LOS = d.LOS[0]
+        LOS.__dict__.pop('_start')
+        try:
+            # Only this LOS's values are then cached.
+            self.data = None
+            gc.collect()
+            derived.set_budget(derived._cache.nbytes + 2 * 8 * len(LOS))
+            volume = LOS.volume
+            dR = weakref.ref(LOS.__dict__['_derived']['dR'][0])
+            derived.set_budget(derived._cache.nbytes - 8 * len(LOS))
+            self.assertIn('volume', LOS.__dict__['_derived'])
+            self.assertNotIn('dR', LOS.__dict__['_derived'])
+            gc.collect()
+            self.assertIsNone(dR())
+            self.assertTrue(np.allclose(LOS.volume, volume))
+        finally:
+            derived.set_budget(derived._DEFAULT_BUDGET)
+
+    def test_budget(self):
+        try:
+            derived.set_budget(0)
+            LOS = self.data.LOS[1]
+            LOS.n_e
+            self.assertNotIn('n_e', LOS.__dict__.get('_derived', {}))
+        finally:
+            derived.set_budget(derived._DEFAULT_BUDGET)
+
+    def test_pickle(self):
+        LOS = self.data.LOS[2]
+        n_e = LOS.n_e
+        copy = pickle.loads(pickle.dumps(LOS))
+        self.assertNotIn('_derived', copy.__dict__)
+        self.assertTrue(np.array_equal(copy.n_e, n_e))
+
+    def test_write_unheld(self):
+        # A derived dR is not written as if it were stored.
+        d = RTData(self.fname)
+        d.load(fields=['R', 'T'])
+        for LOS in d.LOS:
+            LOS.__dict__.pop('_start')
+            self.assertTrue(np.all(LOS.dR > 0))
+        out = os.path.join(self.directory, 'out.bin')
+        d.save(out)
+        e = RTData(out)
+        e.load()
+        for (a, b) in zip(self.data.LOS, e.LOS):
+            self.assertTrue(np.array_equal(a.T, b.T))
+            self.assertFalse(b.dR.any())
+
+    def test_profile_weights(self):
+        edges = np.linspace(0, self.data.to_columnar().columns['R'].max(), 5)
+        profile = RTProfile(edges, ['T'], weights='volume')
+        profile.add(self.data)
+        columns = self.data.to_columnar()
+        bins = np.clip(np.searchsorted(edges, columns.R, side='right') - 1,
+                       0, len(edges) - 2)
+        weight = np.bincount(bins, columns.volume, minlength=len(edges) - 1)
+        self.assertTrue(np.allclose(profile.weight, weight))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from .. import RTData, RTIndex
+from ..rtdata import RTDataIOError
+from ..synthetic import generate
+
+class TestIndex(unittest.TestCase):
+    """Indexes locate each LOS, and sidecars are only used while valid."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+        generate(self.fname, 8, (0, 6), '3.15', seed=30)
+        self.sidecar = RTIndex.sidecar_name(self.fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _assert_equal(self, a, b):
+        for name in ('offsets', 'N_cells', 'cell', 'N_bytes'):
+            self.assertTrue(np.array_equal(getattr(a, name),
+                                           getattr(b, name)), name)
+
+    def test_load_LOS(self):
+        d = RTData(self.fname)
+        d.load()
+        index = RTIndex.build(self.fname)
+        self.assertEqual(len(index), d.header.N_LOS)
+        for i in range(len(index)):
+            self.assertTrue(np.array_equal(index.load_LOS(i).T, d.LOS[i].T))
+
+    def test_sidecar(self):
+        built = RTIndex.get(self.fname, True)
+        self.assertTrue(os.path.exists(self.sidecar))
+        loaded = RTIndex.load(self.fname)
+        self.assertIsNotNone(loaded)
+        self._assert_equal(loaded, built)
+
+    def test_stale_sidecar(self):
+        RTIndex.get(self.fname, True)
+        # A regenerated file is indexed again.
+        generate(self.fname, 5, (0, 6), '3.15', seed=31)
+        self.assertIsNone(RTIndex.load(self.fname))
+        index = RTIndex.get(self.fname, True)
+        self._assert_equal(index, RTIndex.build(self.fname))
+        self.assertIsNotNone(RTIndex.load(self.fname))
+
+        # So is a file touched since, even with the same size.
+        st = os.stat(self.fname)
+        os.utime(self.fname, (st.st_atime, st.st_mtime + 10))
+        self.assertIsNone(RTIndex.load(self.fname))
+
+    def test_file_object(self):
+        with open(self.fname, 'rb') as f:
+            self.assertRaises(RTDataIOError, RTIndex.build, f)
+        self.assertRaises(RTDataIOError, RTIndex.get,
+                          io.BytesIO(b''), True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from .. import RTData, RTIndex
+from ..readers import RTDataIOError
+from ..synthetic import generate
+
+def _stored(LOS):
+    return dict((name, value) for (name, value) in vars(LOS).items()
+                if not name.startswith('_') and name != 'header')
+
+class TestParallelLoad(unittest.TestCase):
+    """load(workers=N) must give the same result as a serial load."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, version, **kwargs):
+        fname = os.path.join(self.directory, 'rt.bin')
+        N_cells = 8 if version == '2.3' else (0, 12)
+        generate(fname, 257, N_cells, version, seed=1, **kwargs)
+
+        serial = RTData(fname)
+        serial.load()
+        parallel = RTData(fname)
+        parallel.get_index()
+        parallel.load(workers=4)
+
+        self.assertEqual(len(parallel.LOS), len(serial.LOS))
+        for (a, b) in zip(serial.LOS, parallel.LOS):
+            a, b = _stored(a), _stored(b)
+            self.assertEqual(sorted(a), sorted(b))
+            for name in a:
+                self.assertEqual(np.asarray(a[name]).dtype,
+                                 np.asarray(b[name]).dtype)
+                self.assertTrue(np.array_equal(a[name], b[name]), name)
+
+    def test_fixed_layout(self):
+        self.check('2.3')
+
+    def test_variable_layout(self):
+        self.check('3.6')
+
+    def test_big_endian_single(self):
+        self.check('3.15', byteorder='>', single=True, rates=False)
+
+    def test_without_index(self):
+        fname = os.path.join(self.directory, 'rt.bin')
+        generate(fname, 10, (0, 6), seed=1)
+        d = RTData(fname, index_cache=True)
+        d.load(workers=4)
+        # Without an index, the load is serial, and records one.
+        self.assertEqual(len(d.LOS), 10)
+        self.assertIsNotNone(d._index)
+        self.assertTrue(os.path.exists(RTIndex.sidecar_name(fname)))
+        again = RTData(fname, index_cache=True)
+        self.assertIsNotNone(again._existing_index())
+
+    def test_recorded_index(self):
+        for (version, N_cells) in (('2.3', 6), ('3.15', (0, 9))):
+            fname = os.path.join(self.directory, 'rt.bin')
+            generate(fname, 30, N_cells, version, seed=2)
+            built = RTIndex.build(fname)
+            for fields in (None, ['R']):
+                d = RTData(fname)
+                d.load(fields=fields)
+                for name in ('offsets', 'N_cells', 'cell', 'N_bytes'):
+                    self.assertTrue(np.array_equal(getattr(d._index, name),
+                                                   getattr(built, name)),
+                                    (version, fields, name))
+
+class TestIterLOS(unittest.TestCase):
+    """iter_los yields the LOS of load, in chunks if asked."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_chunks(self):
+        generate(self.fname, 10, (0, 6), seed=8)
+        d = RTData(self.fname)
+        d.load()
+        chunks = list(RTData(self.fname).iter_los(chunk=4))
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+        for (a, b) in zip(d.LOS, [LOS for chunk in chunks for LOS in chunk]):
+            self.assertTrue(np.array_equal(a.T, b.T))
+
+    def test_no_LOS(self):
+        for version in ('2.3', '3.15'):
+            generate(self.fname, 0, 5, version, seed=8)
+            d = RTData(self.fname)
+            d.load()
+            self.assertEqual(d.LOS, [])
+            self.assertEqual(list(RTData(self.fname).iter_los()), [])
+
+class TestDtypes(unittest.TestCase):
+    """Loading with dtypes converts blocks as they are read."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_convert(self):
+        for (version, N_cells) in (('2.3', 6), ('3.15', (0, 9))):
+            generate(self.fname, 8, N_cells, version, seed=9)
+            full = RTData(self.fname)
+            full.load()
+            d = RTData(self.fname)
+            d.load(dtypes={'float': 'f4', 'R': None})
+            for (a, b) in zip(full.LOS, d.LOS):
+                self.assertEqual(b.R.dtype, a.R.dtype)
+                self.assertTrue(np.array_equal(a.R, b.R))
+                self.assertEqual(b.T.dtype, np.dtype('f4'))
+                self.assertTrue(np.array_equal(a.T.astype('f4'), b.T))
+                # Unconverted blocks do not keep the record they were
+                # read from.
+                self.assertIsNone(b.R.base)
+
+class TestFields(unittest.TestCase):
+    """Loading some fields gives those of a full load; the rest are read
+    on access."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, N_cells, mmap=False):
+        fname = os.path.join(self.directory, 'rt.bin')
+        generate(fname, 6, N_cells, '3.15', byteorder='>', seed=5)
+        full = RTData(fname)
+        full.load()
+        part = RTData(fname, mmap=mmap)
+        part.load(fields=['R', 'T'])
+        for (a, b) in zip(full.LOS, part.LOS):
+            self.assertIn('T', vars(b))
+            self.assertNotIn('D', vars(b))
+            for (name, value) in _stored(a).items():
+                self.assertTrue(np.array_equal(value, getattr(b, name)), name)
+
+    def test_small_bodies(self):
+        self.check((0, 9))
+
+    def test_large_bodies(self):
+        # Bodies beyond _GATHER_BYTES are read a block at a time.
+        self.check((3000, 4000))
+
+    def test_mmap(self):
+        self.check((0, 9), mmap=True)
+
+class TestIndexing(unittest.TestCase):
+    """Indexing before load reads the same LOS as after it."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+        generate(self.fname, 12, (0, 6), seed=4)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_index_and_slice(self):
+        loaded = RTData(self.fname)
+        loaded.load()
+        for index in (0, -1, slice(2, 4), slice(None, None, -5),
+                      slice(10, 20)):
+            expected = loaded[index]
+            found = RTData(self.fname)[index]
+            if isinstance(index, slice):
+                self.assertEqual(len(found), len(expected))
+            else:
+                (expected, found) = ([expected], [found])
+            for (a, b) in zip(expected, found):
+                self.assertTrue(np.array_equal(a.R, b.R))
+
+class TestFileObject(unittest.TestCase):
+    """File objects are read in order; random access needs a file name."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+        generate(self.fname, 12, (0, 6), seed=3)
+        with open(self.fname, 'rb') as f:
+            self.raw = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_load(self):
+        d = RTData(io.BytesIO(self.raw))
+        d.load()
+        e = RTData(self.fname)
+        e.load()
+        self.assertEqual(len(d.LOS), len(e.LOS))
+        for (a, b) in zip(d.LOS, e.LOS):
+            self.assertTrue(np.array_equal(a.R, b.R))
+
+    def test_random_access(self):
+        for access in (lambda d: d[3], lambda d: d.get_index(),
+                       lambda d: d.to_columnar()):
+            with self.assertRaises(RTDataIOError):
+                access(RTData(io.BytesIO(self.raw)))
+        with self.assertRaises(RTDataIOError):
+            RTIndex.build(io.BytesIO(self.raw))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from .. import RTData, RTIndex
+from ..readers import RTDataIOError
+from ..schemadict import _MAX_BODIES
+from ..synthetic import generate
+
+def _set_N_cells(fname, i, N_cells):
+    """Overwrite the N_cells word of LOS i of fname."""
+    index = RTIndex.build(fname)
+    offset = int(index.offsets[i])
+    prefix = index.header._data_plan().prefix
+    with open(fname, 'r+b') as f:
+        f.seek(offset)
+        record = np.frombuffer(f.read(prefix.itemsize), prefix).copy()
+        record['N_cells'] = N_cells
+        f.seek(offset)
+        f.write(record.tobytes())
+
+class TestReadPlan(unittest.TestCase):
+    """Read plans reject corrupt counts and bound their caches."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+        generate(self.fname, 5, (1, 6), '3.6', seed=6)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_corrupt_counts(self):
+        for N_cells in (-5, 2**31 - 1):
+            generate(self.fname, 5, (1, 6), '3.6', seed=6)
+            _set_N_cells(self.fname, 2, N_cells)
+            with self.assertRaises(RTDataIOError):
+                RTData(self.fname).load()
+
+    def test_bounded_bodies(self):
+        d = RTData(self.fname)
+        d.header.load()
+        plan = d.header._data_plan()
+        for N_cells in range(2 * _MAX_BODIES):
+            body = plan.body_for((N_cells,))
+            self.assertEqual(body.itemsize, plan.body_size((N_cells,)))
+        self.assertLessEqual(len(plan._bodies), _MAX_BODIES)
+
+if __name__ == '__main__':
+    unittest.main()
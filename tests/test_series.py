@@ -0,0 +1,56 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from .. import RTData, RTSeries
+from ..synthetic import generate
+
+class TestTrack(unittest.TestCase):
+    """Tracks stack fields through snapshots, and cache them."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = os.path.join(self.directory, 'tracks')
+        self.fnames = [os.path.join(self.directory, 'rt_%d.bin' % i)
+                       for i in range(3)]
+        # Versions 3.6 and 3.15 store cell as int32 and uint64.
+        for (i, (fname, version)) in enumerate(zip(
+                self.fnames, ('3.6', '3.15', '3.15'))):
+            generate(fname, 5, (1, 6), version, seed=20 + i)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stack(self):
+        track = RTSeries(self.fnames).extract(['R', 'cell'], [1, 3])
+        cell = track.get('cell', 3)
+        self.assertEqual(cell.dtype, np.dtype('i8'))
+        self.assertTrue(np.array_equal(cell, [3, 3, 3]))
+        R = track.get('R', 1)
+        for (k, fname) in enumerate(self.fnames):
+            expected = RTData(fname)[1].R
+            self.assertTrue(np.array_equal(R[k, :len(expected)], expected))
+            self.assertTrue(np.isnan(R[k, len(expected):]).all())
+
+    def test_cache(self):
+        series = RTSeries(self.fnames)
+        first = series.extract(['T'], [2], cache=self.cache)
+        self.assertEqual(len(glob.glob(os.path.join(self.cache, '*.npz'))),
+                         len(self.fnames))
+        again = series.extract(['T'], [2], cache=self.cache)
+        self.assertTrue(np.array_equal(first.get('T', 2), again.get('T', 2),
+                                       equal_nan=True))
+
+        # A changed snapshot is extracted again.
+        generate(self.fnames[1], 5, (1, 6), '3.15', seed=99)
+        changed = series.extract(['T'], [2], cache=self.cache)
+        expected = RTData(self.fnames[1])[2].T
+        self.assertTrue(np.array_equal(
+            changed.get('T', 2)[1, :len(expected)], expected))
+
+if __name__ == '__main__':
+    unittest.main()
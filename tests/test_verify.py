@@ -0,0 +1,112 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import RTData, RTIndex
+from ..synthetic import generate
+from ..verify import verify
+from .test_schema import _set_N_cells
+
+class TestVerify(unittest.TestCase):
+    """verify must accept valid files however they are given."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+        generate(self.fname, 20, (0, 8), '3.15', seed=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _gzip(self):
+        compressed = self.fname + '.gz'
+        with open(self.fname, 'rb') as f, gzip.open(compressed, 'wb') as out:
+            shutil.copyfileobj(f, out)
+        return compressed
+
+    def test_file(self):
+        self.assertTrue(verify(self.fname))
+
+    def test_file_object(self):
+        with open(self.fname, 'rb') as f:
+            result = RTData(f).verify()
+        self.assertTrue(result, str(result))
+
+    def test_bytes(self):
+        with open(self.fname, 'rb') as f:
+            result = verify(io.BytesIO(f.read()))
+        self.assertTrue(result, str(result))
+
+    def test_gzip(self):
+        compressed = self._gzip()
+        self.assertTrue(verify(compressed))
+        with gzip.open(compressed) as f:
+            result = verify(f)
+        self.assertTrue(result, str(result))
+
+class TestVerifyErrors(unittest.TestCase):
+    """verify reports damaged files, as files and as streams."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _results(self):
+        """Return the results of verifying the file and a gzip copy."""
+        compressed = self.fname + '.gz'
+        with open(self.fname, 'rb') as f, gzip.open(compressed, 'wb') as out:
+            shutil.copyfileobj(f, out)
+        return [verify(self.fname), verify(compressed)]
+
+    def _truncate(self, size):
+        with open(self.fname, 'r+b') as f:
+            f.truncate(size)
+
+    def test_truncated(self):
+        for version in ('2.3', '3.15'):
+            generate(self.fname, 10, 6 if version == '2.3' else (1, 6),
+                     version, seed=13)
+            self._truncate(os.path.getsize(self.fname) - 3)
+            for result in self._results():
+                self.assertFalse(result)
+                self.assertEqual(result.first_bad, 9)
+                self.assertEqual(result.N_LOS_found, 9)
+
+    def test_truncated_prefix(self):
+        generate(self.fname, 10, (1, 6), '3.15', seed=13)
+        self._truncate(int(RTIndex.build(self.fname).offsets[9]) + 4)
+        result = verify(self.fname)
+        self.assertEqual(result.first_bad, 9)
+        self.assertIn('leading words', result.errors[0])
+
+    def test_extended(self):
+        generate(self.fname, 10, (1, 6), '3.15', seed=13)
+        with open(self.fname, 'ab') as f:
+            f.write(b'\0' * 40)
+        for result in self._results():
+            self.assertFalse(result)
+            self.assertIsNone(result.first_bad)
+            self.assertEqual(result.N_LOS_found, 10)
+
+    def test_garbage_counts(self):
+        for N_cells in (-7, 2**31 - 1):
+            generate(self.fname, 10, (1, 6), '3.6', seed=13)
+            _set_N_cells(self.fname, 4, N_cells)
+            for result in self._results():
+                self.assertFalse(result)
+                self.assertEqual(result.first_bad, 4)
+
+    def test_no_LOS(self):
+        for version in ('2.3', '3.15'):
+            generate(self.fname, 0, 5, version, seed=13)
+            for result in self._results():
+                self.assertTrue(result, str(result))
+
+if __name__ == '__main__':
+    unittest.main()
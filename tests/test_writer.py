@@ -0,0 +1,106 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from .. import RTData, extract, write
+from ..synthetic import generate, generate_all
+
+def _read(fname):
+    with open(fname, 'rb') as f:
+        return f.read()
+
+class TestWrite(unittest.TestCase):
+    """Writing loaded data reproduces its file byte for byte."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.out = os.path.join(self.directory, 'out.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        source = os.path.join(self.directory, 'source')
+        os.mkdir(source)
+        for (fname, settings) in generate_all(source, 4, (0, 5), seed=11):
+            d = RTData(fname)
+            d.load()
+            write(self.out, d)
+            self.assertEqual(_read(self.out), _read(fname), settings)
+            # Unloaded data is read one LOS at a time.
+            RTData(fname).save(self.out)
+            self.assertEqual(_read(self.out), _read(fname), settings)
+
+    def test_stream(self):
+        fname = os.path.join(self.directory, 'rt.bin')
+        generate(fname, 7, (0, 6), seed=11)
+        write(self.out, RTData(io.BytesIO(_read(fname))))
+        self.assertEqual(_read(self.out), _read(fname))
+
+    def test_convert(self):
+        fname = os.path.join(self.directory, 'rt.bin')
+        generate(fname, 7, (0, 6), '3.15', seed=11)
+        d = RTData(fname)
+        d.load()
+        d.save(self.out, version='3.6', byteorder='>')
+        e = RTData(self.out)
+        e.load()
+        self.assertEqual(e.header.version, '3.6')
+        common = set(d.header._data_plan().cell_fields) & \
+            set(e.header._data_plan().cell_fields)
+        for (a, b) in zip(d.LOS, e.LOS):
+            for name in common:
+                self.assertTrue(np.array_equal(getattr(a, name),
+                                               getattr(b, name)), name)
+
+class TestExtract(unittest.TestCase):
+    """extract writes chosen LOS, copied or with fields dropped."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'rt.bin')
+        self.out = os.path.join(self.directory, 'out.bin')
+        generate(self.fname, 9, (0, 6), '3.15', seed=12)
+        self.data = RTData(self.fname)
+        self.data.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_copy(self):
+        LOS = [3, 1, 4, -1]
+        extract(self.fname, self.out, LOS)
+        e = RTData(self.out)
+        e.load()
+        self.assertEqual(e.header.N_LOS, len(LOS))
+        self.assertTrue(e.verify())
+        for (i, b) in zip(LOS, e.LOS):
+            a = self.data[i]
+            for name in a.header._data_plan().cell_fields:
+                self.assertTrue(np.array_equal(getattr(a, name),
+                                               getattr(b, name)), name)
+
+    def test_all(self):
+        extract(self.fname, self.out)
+        self.assertEqual(_read(self.out), _read(self.fname))
+
+    def test_fields(self):
+        extract(self.fname, self.out, [0, 2], fields=['R', 'T'], single=True)
+        e = RTData(self.out)
+        e.load()
+        self.assertTrue(e.verify())
+        self.assertFalse(e.header.flag_rates)
+        self.assertFalse(e.header.flag_Ncols)
+        self.assertTrue(e.header.flag_single)
+        for (i, b) in zip([0, 2], e.LOS):
+            a = self.data[i]
+            self.assertNotIn('G', vars(b))
+            self.assertNotIn('Ncols', vars(b))
+            self.assertTrue(np.array_equal(a.T.astype('f4'), b.T))
+
+if __name__ == '__main__':
+    unittest.main()
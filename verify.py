@@ -0,0 +1,294 @@
+"""Check the structure of RT snapshot files without reading their data.
+
+Usage: python -m <package>.verify [-q] FILE [FILE ...]
+
+Exits with status 0 if every file is consistent, and 1 otherwise.
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+from .readers import RTDataIOError, _open_reader, _plain_file
+from .rtdata import RTHeader, RTLOS
+from .schemadict import schema_dict
+
+class RTVerification(object):
+    """
+    The result of checking the structure of an RT file.
+
+    Contains the members
+        fname         The file checked
+        ok            True if no errors were found (also the truth value)
+        version       The file version, or None if the header is unreadable
+        N_LOS         The number of LOS according to the header
+        N_LOS_found   The number of complete LOS found in the file
+        size          The size of the file in bytes (None if compressed)
+        expected_size The size implied by the header and the LOS walked; a
+                      lower bound if the file is truncated
+        first_bad     The index of the first inconsistent LOS, or None
+        errors        A list of messages describing each error found
+        warnings      A list of messages describing suspicious values which
+                      do not prevent the file being read
+    """
+
+    def __init__(self, fname):
+        super(RTVerification, self).__init__()
+        self.fname = fname
+        self.version = None
+        self.N_LOS = None
+        self.N_LOS_found = 0
+        self.size = None
+        self.expected_size = None
+        self.first_bad = None
+        self.errors = []
+        self.warnings = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __bool__(self):
+        return self.ok
+
+    __nonzero__ = __bool__
+
+    def __str__(self):
+        status = 'OK' if self.ok else 'FAILED'
+        lines = ["%s: %s" % (self.fname, status)]
+        if self.version is not None:
+            lines.append("  version %s, N_LOS %d (found %d), size %s "
+                         "(expected %s)" % (self.version, self.N_LOS,
+                                            self.N_LOS_found, self.size,
+                                            self.expected_size))
+        lines += ["  error: " + message for message in self.errors]
+        lines += ["  warning: " + message for message in self.warnings]
+        return '\n'.join(lines)
+
+def verify(fname):
+    """Check the structure of the RT file fname, returning an RTVerification.
+
+    Only the header and the single-valued words at the start of each LOS are
+    read; the size of each LOS follows from its N_cells and the schema of
+    the file's version, so the walk seeks straight past its data. The walk
+    stops at the first LOS which would extend beyond the end of the file.
+    Compressed files are checked too, but must be decompressed as they are
+    walked.
+    """
+    result = RTVerification(fname)
+    header = RTHeader(fname)
+    try:
+        f = _open_reader(fname)
+    except (IOError, ValueError) as e:
+        result.errors.append("Cannot read header: %s" % e)
+        return result
+    with f:
+        # The header and the LOS are read through one reader, so that a
+        # stream given as fname is read once.
+        try:
+            header._read(f)
+        except (IOError, ValueError) as e:
+            result.errors.append("Cannot read header: %s" % e)
+            return result
+        result.version = header.version
+        result.N_LOS = int(header.N_LOS)
+
+        start = schema_dict.header_dtype(header._version_key,
+                                         header._byteorder).itemsize
+        plan = header._data_plan()
+        result.expected_size = start
+        if _plain_file(fname):
+            result.size = os.path.getsize(fname)
+            with open(fname, 'rb') as raw:
+                data = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    _walk(result, header, plan, start, data)
+                finally:
+                    data.close()
+        else:
+            _walk_stream(result, header, plan, start, f)
+    return result
+
+def _walk(result, header, plan, start, data):
+    """Walk the LOS of a file held in the buffer data."""
+    size = result.size
+    if plan.fixed:
+        record = plan.dtype(RTLOS(header)).itemsize
+        result.expected_size = start + result.N_LOS * record
+        found = (size - start) // record if record else result.N_LOS
+        result.N_LOS_found = int(min(found, result.N_LOS))
+        if found < result.N_LOS:
+            result.first_bad = result.N_LOS_found
+            result.errors.append(
+                "File is truncated: LOS %d ends at byte %d, beyond the end "
+                "of the file (%d bytes)" % (result.first_bad,
+                                            start + (result.first_bad + 1)
+                                            * record, size))
+        _check_size(result, found)
+        return
+
+    # Beyond the header's N_LOS, whole LOS are counted but not checked.
+    prefix = struct.Struct(_struct_format(plan.prefix))
+    names = plan.prefix.names
+    offset = start
+    i = 0
+    while offset < size or i < result.N_LOS:
+        if offset + prefix.size > size:
+            if i < result.N_LOS:
+                _bad(result, i, "LOS %d is truncated: its leading words "
+                     "(%s) run from byte %d to %d, beyond the end of the "
+                     "file (%d bytes)" % (i, ', '.join(names), offset,
+                                         offset + prefix.size, size))
+                result.expected_size = offset + prefix.size
+            break
+        values = dict(zip(names, prefix.unpack_from(data, offset)))
+        end = _end(header, plan, values, offset)
+        if end is None:
+            if i < result.N_LOS:
+                _bad(result, i, _invalid(i, values))
+            break
+        if i < result.N_LOS:
+            _check_N_bytes(result, plan, values, offset, end, i)
+        if end > size:
+            if i < result.N_LOS:
+                _bad(result, i, "LOS %d (%d cells) ends at byte %d, beyond "
+                     "the end of the file (%d bytes)"
+                     % (i, values.get('N_cells', 0), end, size))
+                result.expected_size = end
+            break
+        offset = end
+        i += 1
+        if i == result.N_LOS:
+            result.expected_size = offset
+
+    result.N_LOS_found = min(i, result.N_LOS)
+    if result.first_bad is None:
+        _check_size(result, i)
+
+def _walk_stream(result, header, plan, start, f):
+    """Walk the LOS of a compressed file or file object by reading and
+    skipping, through the reader f from which the header was read."""
+    offset = start
+    i = 0
+    try:
+        for i in range(result.N_LOS):
+            f.seek(offset)
+            values = {}
+            if plan.prefix is not None:
+                record = f.read(plan.prefix, 1)
+                values = dict((name, record[name][0])
+                              for name in plan.prefix.names)
+            end = _end(header, plan, values, offset)
+            if end is None:
+                _bad(result, i, _invalid(i, values))
+                return
+            _check_N_bytes(result, plan, values, offset, end, i)
+            # Reading the last byte checks that the LOS is complete.
+            f.seek(end - 1)
+            f.read('u1', 1)
+            offset = end
+        else:
+            i = result.N_LOS
+    except RTDataIOError:
+        _bad(result, i, "LOS %d ends beyond the end of the file" % i)
+        return
+    finally:
+        result.N_LOS_found = i
+        result.expected_size = offset
+
+    f.seek(offset)
+    try:
+        f.read('u1', 1)
+    except RTDataIOError:
+        return
+    result.errors.append("File continues beyond the %d LOS in its header"
+                         % result.N_LOS)
+
+def _end(header, plan, values, offset):
+    """Return the end of the LOS starting at offset with prefix values, or
+    None if they are invalid.
+
+    The size is computed from the counts without building a dtype, so that
+    garbage counts give an end beyond the file rather than an exception.
+    """
+    counts = []
+    for count in plan.counts:
+        if count.startswith('header.'):
+            counts.append(int(getattr(header, count[len('header.'):])))
+        else:
+            counts.append(int(values[count]))
+    body = plan.body_size(tuple(counts))
+    if body is None:
+        return None
+    prefix = plan.prefix.itemsize if plan.prefix is not None else 0
+    return offset + prefix + body
+
+def _invalid(i, values):
+    """Return the error for LOS i, whose prefix values give a negative
+    count."""
+    if 'N_cells' in values and int(values['N_cells']) < 0:
+        return "LOS %d has a negative N_cells (%d)" % (i, values['N_cells'])
+    return "LOS %d has a negative block count (%s)" % (
+        i, ', '.join("%s=%d" % (name, values[name]) for name in sorted(values)))
+
+def _check_N_bytes(result, plan, values, offset, end, i):
+    """Warn (once) if the N_bytes word of LOS i does not match its size."""
+    if 'N_bytes' not in values or result.warnings:
+        return
+    body = end - offset - plan.prefix.itemsize
+    if int(values['N_bytes']) not in (body, end - offset):
+        result.warnings.append("LOS %d has N_bytes %d, but holds %d bytes of "
+                               "data" % (i, values['N_bytes'], body))
+
+def _bad(result, i, message):
+    result.first_bad = i
+    result.errors.append(message)
+
+def _check_size(result, found):
+    """Record an error if the file holds more than the header's LOS."""
+    if result.size > result.expected_size:
+        extra = result.size - result.expected_size
+        if found > result.N_LOS:
+            result.errors.append("Header N_LOS is %d, but the file holds at "
+                                 "least %d LOS" % (result.N_LOS, found))
+        else:
+            result.errors.append("%d bytes of unexpected data after the last "
+                                 "LOS" % extra)
+
+# struct format characters of standard size, by numpy kind and itemsize.
+_STRUCT_CHARS = {('i', 1): 'b', ('i', 2): 'h', ('i', 4): 'i', ('i', 8): 'q',
+                 ('u', 1): 'B', ('u', 2): 'H', ('u', 4): 'I', ('u', 8): 'Q',
+                 ('f', 4): 'f', ('f', 8): 'd'}
+
+def _struct_format(dtype):
+    """Return the struct format of a structured dtype of scalar fields."""
+    chars = []
+    byteorder = '<' if sys.byteorder == 'little' else '>'
+    for name in dtype.names:
+        field = dtype.fields[name][0]
+        if field.byteorder in '<>':
+            byteorder = field.byteorder
+        chars.append(_STRUCT_CHARS[(field.kind, field.itemsize)])
+    return byteorder + ''.join(chars)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check the structure of RT snapshot files without "
+                    "reading their data.")
+    parser.add_argument('files', nargs='+', metavar='FILE')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="only report files with errors")
+    args = parser.parse_args(argv)
+
+    status = 0
+    for fname in args.files:
+        result = verify(fname)
+        if not result.ok:
+            status = 1
+        if not result.ok or not args.quiet:
+            print(result)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+import itertools
+import os
+
+import numpy as np
+
+from . import derived
+from .index import RTIndex
+from .readers import RTDataIOError, _open_reader, _plain_file
+from .rtdata import RTData, RTHeader, RTLOS
+from .schemadict import schema_dict
+
+# The most data buffered before it is written.
+_WRITE_BYTES = 1 << 24
+
+def write(fname, data, version=None, byteorder=None, single=None):
+    """Write RT data to fname.
+
+    data is an RTData (whose lines of sight are read one at a time if it has
+    not been loaded), or a sequence of RTLOS sharing one header. The file is
+    written in the given version (a string 'x.y'; default: that of the data),
+    byte order ('<', '>' or '='; default: that of the data) and, for versions
+    with a flag_single, precision (default: that of the data).
+
+    Each LOS is written as a single record of its layout in the schema of the
+    version. Blocks which the data does not hold are written as zeros, and
+    N_bytes as the number of bytes following the N_bytes word, unless the
+    layout is unchanged. Version 2.3 requires every LOS to have the same
+    number of cells.
+    """
+    if isinstance(data, RTData):
+        LOS = data.LOS
+        if not LOS:
+            # The header is read by iter_los; reading it separately first
+            # would consume a stream given as the file.
+            LOS = data.iter_los()
+            first = next(LOS, None)
+            if first is not None:
+                LOS = itertools.chain([first], LOS)
+        header = data.header
+    elif len(data):
+        LOS = data
+        header = LOS[0].header
+    else:
+        raise ValueError("Cannot write an RT file without a header")
+
+    with open(fname, 'wb') as f:
+        writer = _RTWriter(f, version, byteorder, single)
+        writer.begin(header)
+        for (i, los) in enumerate(LOS):
+            writer.write(los, i)
+        writer.end()
+
+def _stored(source, name):
+    """Return the field name of source, or None if it does not hold it.
+
+    A derived quantity of the same name (such as dR) is not a stored field,
+    so is not written.
+    """
+    attributes = getattr(source, '__dict__', {})
+    if name in derived._registry and name not in attributes and not \
+            (isinstance(source, RTLOS) and source._lazy_block(name)):
+        return None
+    return getattr(source, name, None)
+
+def extract(fname, out_fname, LOS=None, fields=None, single=None,
+            index_cache=False):
+    """Write a new RT file holding some lines of sight of fname.
+
+    LOS is a sequence of LOS indices, in the order to write them (default:
+    all). If fields is not None, blocks which are optional in the file's
+    version (those controlled by flag_rates, flag_velocities, flag_Ncols and
+    flag_refinements) are dropped, and their flags cleared, if none of their
+    fields are named. single is as for write. index_cache is as for RTData.
+
+    If nothing is dropped or converted, each run of consecutive lines of sight
+    is copied byte for byte, within the kernel where possible
+    (os.copy_file_range, or os.sendfile), so data does not pass through
+    Python.
+    """
+    index = RTIndex.get(fname, index_cache)
+    header = getattr(index, 'header', None)
+    if header is None:
+        header = RTHeader(fname)
+        header.load()
+    if LOS is None:
+        LOS = np.arange(len(index))
+    LOS = np.asarray(LOS, dtype='i8')
+    LOS = np.arange(len(index))[LOS]
+
+    flags = _dropped_flags(header, fields)
+    if not flags and (single is None or
+                      bool(single) == bool(header.flag_single)) \
+            and _plain_file(fname):
+        _copy_LOS(fname, out_fname, header, index, LOS)
+        return
+
+    out = RTHeader(fname)
+    out.__dict__.update(header.__dict__)
+    for name in flags:
+        setattr(out, name, 0)
+    plan = out._data_plan()
+    stored = plan.cell_fields + plan.los_fields
+    with open(out_fname, 'wb') as f:
+        writer = _RTWriter(f, None, None, single)
+        writer.begin(out)
+        for (n, i) in enumerate(LOS):
+            writer.write(index.load_LOS(i, header, fields=stored), n)
+        writer.end()
+
+class _RTWriter(object):
+    """Write an RT header and LOS records to an open binary file.
+
+    The header is written (with N_LOS and N_cells filled in) by end, once all
+    LOS are known. Records are buffered and written in large blocks.
+    """
+
+    def __init__(self, f, version, byteorder, single):
+        super(_RTWriter, self).__init__()
+        self.f = f
+        self.version = version
+        self.byteorder = byteorder
+        self.single = single
+        self.header = None
+        self.N_LOS = 0
+        self.N_cells = 0
+        self._buffer = []
+        self._buffered = 0
+
+    def begin(self, source):
+        """Prepare to write data with the given source header."""
+        if self.version is None:
+            key = source._version_key
+        else:
+            key = "%02d%02d" % tuple(int(v) for v in self.version.split('.'))
+        if key not in schema_dict:
+            raise RTDataIOError("Unsupported RT file version " + str(key))
+        byteorder = self.byteorder or source._byteorder
+
+        header_schema, flags, _ = schema_dict[key]
+        header = RTHeader(self.f.name if hasattr(self.f, 'name') else None)
+        header._byteorder = byteorder
+        header._version_key = key
+        header._version = (int(key[:2]), int(key[2:]))
+        for (name, value) in flags.items():
+            setattr(header, name, value)
+        # Flags stored in the header may be set from the source.
+        for name in header_schema:
+            if name.startswith('flag_') and hasattr(source, name):
+                setattr(header, name, getattr(source, name))
+        if self.single is not None and 'flag_single' in header_schema:
+            header.flag_single = int(bool(self.single))
+        for name in ('expansion_factor', 'redshift', 'time'):
+            setattr(header, name, getattr(source, name, 0))
+        header.N_cells = getattr(source, 'N_cells', 0)
+
+        self.header = header
+        self.plan = header._data_plan()
+        self._same = key == source._version_key and all(
+            bool(getattr(header, name)) == bool(getattr(source, name, False))
+            for name in schema_dict.plan_flags(key))
+
+        # Leave space for the header, which is written last.
+        self.f.write(b'\0' * schema_dict.header_dtype(key, byteorder).itemsize)
+
+    def write(self, source, i):
+        """Write the LOS source, the ith in the file."""
+        N_cells = len(source)
+        if self.plan.fixed:
+            if self.N_LOS == 0:
+                self.header.N_cells = N_cells
+            elif N_cells != self.header.N_cells:
+                raise ValueError("Every LOS must have the same number of cells "
+                                 "in version " + self.header.version)
+
+        LOS = RTLOS(self.header)
+        LOS.N_cells = N_cells
+        record = np.zeros(1, dtype=self.plan.dtype(LOS))
+        for name in record.dtype.names:
+            if name == '_N_cells' or name == 'N_cells':
+                record[name] = N_cells
+            elif name == 'cell':
+                record[name] = getattr(source, 'cell', i)
+            elif name == 'N_bytes':
+                if self._same and hasattr(source, 'N_bytes'):
+                    record[name] = source.N_bytes
+                else:
+                    record[name] = self.plan.body(LOS).itemsize
+            elif not name.startswith('_') and \
+                    name in self.plan.cell_fields + self.plan.los_fields:
+                value = _stored(source, name)
+                if value is not None:
+                    record[name][0] = value
+
+        self._append(record, N_cells)
+
+    def _append(self, records, N_cells):
+        """Buffer complete LOS records, the largest of which has N_cells."""
+        self.N_LOS += len(records)
+        self.N_cells = max(self.N_cells, N_cells)
+        self._buffer.append(records)
+        self._buffered += records.nbytes
+        if self._buffered >= _WRITE_BYTES:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self.f.write(b''.join(record.tobytes() for record in self._buffer))
+        self._buffer = []
+        self._buffered = 0
+
+    def end(self):
+        """Flush all records, and write the header."""
+        self._flush()
+        header = self.header
+        if not self.plan.fixed:
+            header.N_cells = self.N_cells
+        header.N_LOS = self.N_LOS
+
+        dtype = schema_dict.header_dtype(header._version_key, header._byteorder)
+        record = np.zeros(1, dtype=dtype)
+        record['_endian_check'] = 1
+        record['ver_major'], record['ver_minor'] = header._version
+        for name in dtype.names:
+            if not name.startswith('_') and name not in ('ver_major',
+                                                         'ver_minor'):
+                record[name] = getattr(header, name)
+        self.f.seek(0)
+        self.f.write(record.tobytes())
+        self.f.seek(0, os.SEEK_END)
+
+def _dropped_flags(header, fields):
+    """Return the header flags which may be cleared when only fields are
+    wanted."""
+    if fields is None:
+        return []
+    header_schema, _, data_schema = schema_dict[header._version_key]
+    blocks = {}
+    for (name, fmt) in data_schema.items():
+        if len(fmt) == 3 and isinstance(fmt[2], str):
+            flag = fmt[2][len('header.'):]
+            blocks.setdefault(flag, []).append(name)
+    return sorted(flag for (flag, names) in blocks.items()
+                  if flag in header_schema and getattr(header, flag)
+                  and not set(names) & set(fields))
+
+def _copy_LOS(fname, out_fname, header, index, LOS):
+    """Copy the header and the records of LOS from fname to out_fname."""
+    dtype = schema_dict.header_dtype(header._version_key, header._byteorder)
+    with _open_reader(fname) as f:
+        record = f.read(dtype, 1).copy()
+    record['N_LOS'] = len(LOS)
+
+    starts = index.offsets[:-1][LOS]
+    stops = index.offsets[1:][LOS]
+    # Merge runs of consecutive LOS into single ranges.
+    breaks = np.nonzero(starts[1:] != stops[:-1])[0] + 1
+    starts = starts[np.concatenate([[0], breaks])] if len(LOS) else starts
+    stops = stops[np.concatenate([breaks - 1, [len(LOS) - 1]])] \
+        if len(LOS) else stops
+
+    with open(fname, 'rb') as src, open(out_fname, 'wb') as dst:
+        dst.write(record.tobytes())
+        dst.flush()
+        for (start, stop) in zip(starts, stops):
+            _copy_range(src, dst, int(start), int(stop - start))
+
+def _copy_range(src, dst, offset, count):
+    """Append count bytes of src, starting at offset, to dst."""
+    while count > 0:
+        n = 0
+        try:
+            if hasattr(os, 'copy_file_range'):
+                n = os.copy_file_range(src.fileno(), dst.fileno(), count,
+                                       offset)
+            elif hasattr(os, 'sendfile'):
+                n = os.sendfile(dst.fileno(), src.fileno(), offset, count)
+        except OSError:
+            n = 0
+        if n == 0:
+            # Not supported here (or the source ended); copy through Python.
+            src.seek(offset)
+            data = src.read(min(count, _WRITE_BYTES))
+            if not data:
+                raise RTDataIOError("Unexpected end of file " + src.name)
+            dst.seek(0, os.SEEK_END)
+            n = dst.write(data)
+            dst.flush()
+        offset += n
+        count -= n